@@ -0,0 +1,209 @@
+"""Adaptive condition ordering driven by observed selectivity.
+
+The static estimates in ruleset.py pick a sensible default order, but which
+condition rejects a row first depends on the data in a run. The
+ConditionProfiler times every condition of every rule on the first rows of a
+batch, counts how often each one is false, and then reorders the conditions of
+each rule by observed cost / P(false) for the rest of the batch.
+
+Conditions within a rule are a pure AND and evaluate_condition has no side
+effects, so the order never changes whether a rule matches. Learned statistics
+are kept in a small JSON file so later runs start from the learned order.
+"""
+
+import copy
+import json
+import os
+import time
+from .operators import evaluate_condition
+
+DEFAULT_SAMPLE_SIZE = 200
+
+# Weight kept from previous runs when new observations are merged in, so the
+# learned order follows the data without forgetting it after a single run
+STATS_DECAY = 0.5
+
+ORDER_CACHE_VERSION = 1
+
+
+def default_order_cache():
+    """Return the default path of the learned condition order file."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'qrate', 'condition_order.json')
+
+
+def condition_signature(condition):
+    """Stable identifier for a condition, independent of its position in the rule."""
+    return json.dumps(condition, sort_keys=True, default=str)
+
+
+class ConditionStats:
+    """Observed evaluations, false results and time spent for one condition."""
+
+    __slots__ = ('evaluated', 'false', 'seconds')
+
+    def __init__(self, evaluated=0.0, false=0.0, seconds=0.0):
+        self.evaluated = evaluated
+        self.false = false
+        self.seconds = seconds
+
+    def rank(self):
+        """Average cost per row rejected; lower ranks are evaluated first."""
+        if not self.evaluated:
+            return None
+        p_false = self.false / self.evaluated
+        return (self.seconds / self.evaluated) / max(p_false, 1e-6)
+
+    def to_dict(self):
+        return {'evaluated': self.evaluated, 'false': self.false, 'seconds': self.seconds}
+
+
+def _load_stats(values):
+    """ConditionStats from a cache entry, or None if the entry is malformed."""
+    if not isinstance(values, dict) or not set(values) <= set(ConditionStats.__slots__):
+        return None
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+               for value in values.values()):
+        return None
+    return ConditionStats(**values)
+
+
+class ConditionProfiler:
+    """Measure condition selectivity on a sample of rows and reorder rules."""
+
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE, cache_file=None):
+        self.sample_size = sample_size
+        self.cache_file = cache_file
+        self.stats = {}
+        self.learned = {}
+        if cache_file:
+            self.load(cache_file)
+
+    def load(self, cache_file):
+        """Load statistics learned in previous runs, ignoring unreadable files."""
+        try:
+            with open(cache_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('version') != ORDER_CACHE_VERSION:
+            return
+        rules = data.get('rules')
+        if not isinstance(rules, dict):
+            return
+        # Skip malformed entries, e.g. from a hand-edited file, rather than failing the run
+        for rule_id, conditions in rules.items():
+            if not isinstance(conditions, dict):
+                continue
+            learned = {}
+            for signature, values in conditions.items():
+                stats = _load_stats(values)
+                if stats is not None:
+                    learned[signature] = stats
+            if learned:
+                self.learned[rule_id] = learned
+
+    def save(self, cache_file=None):
+        """Merge this run's observations into the learned statistics and write them out."""
+        cache_file = cache_file or self.cache_file
+        if not cache_file:
+            return
+        merged = self.merged_stats()
+        data = {
+            'version': ORDER_CACHE_VERSION,
+            'rules': {
+                rule_id: {signature: stats.to_dict() for signature, stats in conditions.items()}
+                for rule_id, conditions in merged.items()
+            },
+        }
+        directory = os.path.dirname(cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{cache_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, cache_file)
+
+    def merged_stats(self):
+        """Combine decayed statistics from earlier runs with this run's."""
+        merged = {}
+        for rule_id, conditions in self.learned.items():
+            merged[rule_id] = {
+                signature: ConditionStats(stats.evaluated * STATS_DECAY,
+                                          stats.false * STATS_DECAY,
+                                          stats.seconds * STATS_DECAY)
+                for signature, stats in conditions.items()
+            }
+        for rule_id, conditions in self.stats.items():
+            target = merged.setdefault(rule_id, {})
+            for signature, stats in conditions.items():
+                existing = target.get(signature)
+                if existing is None:
+                    target[signature] = ConditionStats(stats.evaluated, stats.false, stats.seconds)
+                else:
+                    existing.evaluated += stats.evaluated
+                    existing.false += stats.false
+                    existing.seconds += stats.seconds
+        return merged
+
+    def check_rule_conditions(self, row, rule):
+        """Evaluate a rule like check_rule_conditions while profiling every condition.
+
+        Conditions after the first false one are still evaluated so their
+        selectivity can be measured. Errors from those extra evaluations are
+        counted as false and never escape, so results match the plain check.
+        """
+        rule_stats = self.stats.setdefault(rule.get('id', 'unknown'), {})
+        result = True
+        for condition in rule.get('conditions', []):
+            signature = condition_signature(condition)
+            stats = rule_stats.get(signature)
+            if stats is None:
+                stats = rule_stats[signature] = ConditionStats()
+
+            start = time.perf_counter()
+            if result:
+                met = evaluate_condition(row, condition)
+            else:
+                try:
+                    met = evaluate_condition(row, condition)
+                except Exception:
+                    met = False
+            stats.seconds += time.perf_counter() - start
+            stats.evaluated += 1
+            if not met:
+                stats.false += 1
+                result = False
+        return result
+
+    def reorder(self, rules, stats=None):
+        """Return a copy of rules with conditions sorted by observed cost / P(false).
+
+        Conditions without observations keep their current relative position
+        at the end of the rule.
+        """
+        if stats is None:
+            stats = self.merged_stats()
+        reordered = []
+        for rule in rules:
+            conditions = rule.get('conditions')
+            rule_stats = stats.get(rule.get('id', 'unknown'))
+            if not rule_stats or not isinstance(conditions, list) or len(conditions) < 2:
+                reordered.append(rule)
+                continue
+
+            def key(condition):
+                observed = rule_stats.get(condition_signature(condition))
+                rank = observed.rank() if observed is not None else None
+                return (rank is None, rank or 0.0)
+
+            rule = copy.copy(rule)
+            rule['conditions'] = sorted(conditions, key=key)
+            reordered.append(rule)
+        return reordered
+
+    def learned_order(self, rules):
+        """Apply the order learned in previous runs, if any."""
+        if not self.learned:
+            return rules
+        return self.reorder(rules, stats=self.learned)
@@ -1,4 +1,5 @@
 import csv
+from . import telemetry
 
 def read_csv(file_path):
     """Read CSV file into a list of dictionaries.
@@ -9,21 +10,33 @@ def read_csv(file_path):
     Returns:
         List of dictionaries representing QC data rows
     """
-    with open(file_path, 'r', newline='') as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    with telemetry.span('read_csv', file=str(file_path)):
+        with open(file_path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            rows = list(reader)
+    if telemetry.active is not None:
+        telemetry.active.add('qrate_rows_total', len(rows), stage='read')
+    return rows
 
-def write_csv(data, file_path):
+def write_csv(data, file_path, fieldnames=None):
     """Write list of dictionaries to CSV file.
     
     Args:
         data: List of dictionaries representing QC data rows
         file_path: Output file path
+        fieldnames: Columns to write (default: the keys of the first row);
+            other keys are left out and missing ones written empty
     """
     if not data:
         return
         
-    with open(file_path, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
+    with telemetry.span('write_csv', file=str(file_path)):
+        with open(file_path, 'w', newline='') as f:
+            if fieldnames is None:
+                writer = csv.DictWriter(f, fieldnames=data[0].keys())
+            else:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(data)
+    if telemetry.active is not None:
+        telemetry.active.add('qrate_rows_total', len(data), stage='write')
@@ -1,6 +1,16 @@
-from .operators import evaluate_condition
+from .operators import evaluate_condition, compile_condition, compile_batch
+from .history_store import split_rule_ids
+from .ruleset import COMMENT_PARTS_KEY, RULE_BIT_KEY, SKIP_MASK_KEY, DEFAULT_COMMENT_PREFIXES, split_comment
+from .rule_trace import TRACE_COLUMN, format_trace
+from .adaptive import condition_signature
+from . import telemetry
 import yaml
 import os
+import time
+from itertools import islice
+
+# Rows per chunk of curate_data whose rule conditions are evaluated in batch
+BATCH_SIZE = 4096
 
 def has_field_action(rule, field):
     """Check if a rule has an action for the specified field."""
@@ -15,6 +25,81 @@ def check_rule_conditions(row, rule):
             return False
     return True
 
+def compile_rule(rule):
+    """Return (single-row checks, batch evaluators, signatures) for a rule's conditions."""
+    conditions = rule.get('conditions', [])
+    return (tuple(compile_condition(condition) for condition in conditions),
+            tuple(compile_batch(condition) for condition in conditions),
+            tuple(condition_signature(condition) for condition in conditions))
+
+# Placeholder for condition results not yet evaluated in a SharedConditions chunk
+_NOT_EVALUATED = object()
+
+class SharedConditions:
+    """Condition results for the chunk of rows being curated, shared between engines.
+
+    Results are keyed by condition signature, so a condition used by several
+    rulesets is evaluated once per row, and a rule whose conditions appear in
+    several rulesets is checked once per chunk. A row's result is computed the first
+    time any rule needs it, so conditions are evaluated for the same rows as
+    when each ruleset is curated on its own. The owner calls clear() before
+    each chunk; every engine must be given the same chunk of rows.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.rule_results = {}
+
+    def clear(self):
+        self.results = {}
+        self.rule_results = {}
+
+    def rule_met(self, signatures, batches, rows):
+        """Return evaluate_rule_batch results, reused for rules with the same conditions."""
+        met = self.rule_results.get(signatures)
+        if met is None:
+            met = self.rule_results[signatures] = evaluate_rule_batch(rows, batches, signatures, self)
+        return met
+
+    def evaluate(self, signature, evaluate, rows, candidates):
+        """Return a condition's results for rows[index] for each index in candidates."""
+        results = self.results.get(signature)
+        if results is None:
+            results = self.results[signature] = [_NOT_EVALUATED] * len(rows)
+        missing = [index for index in candidates if results[index] is _NOT_EVALUATED]
+        if missing:
+            for index, met in zip(missing, evaluate([rows[index] for index in missing])):
+                results[index] = met
+        return [results[index] for index in candidates]
+
+def evaluate_rule_batch(rows, batches, signatures=(), shared=None):
+    """Return for each row whether all of a rule's conditions are met.
+
+    Each condition is evaluated over the rows that met the conditions before
+    it, so conditions are evaluated for the same rows as when short-circuiting
+    row by row. With a SharedConditions, results are looked up by signature
+    and only evaluated for rows that no other rule has needed them for.
+    """
+    candidates = None
+    for position, evaluate in enumerate(batches):
+        if candidates is None:
+            candidates = range(len(rows))
+            results = (evaluate(rows) if shared is None
+                       else shared.evaluate(signatures[position], evaluate, rows, candidates))
+        elif shared is None:
+            results = evaluate([rows[index] for index in candidates])
+        else:
+            results = shared.evaluate(signatures[position], evaluate, rows, candidates)
+        candidates = [index for index, met in zip(candidates, results) if met]
+        if not candidates:
+            return [False] * len(rows)
+    if candidates is None:
+        return [True] * len(rows)
+    met = [False] * len(rows)
+    for index in candidates:
+        met[index] = True
+    return met
+
 def get_rule_action(rule, field):
     for action in rule.get('actions', []):
         if action.get('field') == field:
@@ -28,16 +113,21 @@ def get_rule_comment(rule):
             return action.get('value', '')
     return ''
 
-def evaluate_mms_rule(row, rules, field, verbose=False):
+def evaluate_mms_rule(row, rules, field, verbose=False, check_conditions=check_rule_conditions):
     """Evaluate all matching rules for a field and aggregate results."""
+    recorder = telemetry.active
+    if recorder is not None:
+        start = time.perf_counter()
     relevant_rules = [rule for rule in rules if has_field_action(rule, field)]
     matched_rules = []
     rule_evaluations = []
     skipped_rules = set()
+    # Trace bits of rules met and of rules skipped by a met rule
+    met_mask = skip_mask = 0
     
     # First pass: identify which rules are met and which should be skipped
     for rule in relevant_rules:
-        rule_met = check_rule_conditions(row, rule)
+        rule_met = check_conditions(row, rule)
         rule_evaluations.append({
             'rule_id': rule.get('id', 'unknown'),
             'description': rule.get('description', ''),
@@ -45,6 +135,8 @@ def evaluate_mms_rule(row, rules, field, verbose=False):
         })
         
         if rule_met:
+            met_mask |= rule.get(RULE_BIT_KEY, 0)
+            skip_mask |= rule.get(SKIP_MASK_KEY, 0)
             
             # If this rule is met, add any rules it wants to skip to the skip set
             skip_list = rule.get('skip_rules', [])
@@ -53,10 +145,13 @@ def evaluate_mms_rule(row, rules, field, verbose=False):
             action = get_rule_action(rule, field)
             comment = get_rule_comment(rule)
             if action:  # Only add if there's an action for this field
+                comment_parts = rule.get(COMMENT_PARTS_KEY)
                 matched_rules.append({
                     'status': action,
                     'comment': comment,
-                    'rule_id': rule.get('id', 'unknown')
+                    'comment_body': comment_parts[1] if comment_parts is not None else None,
+                    'rule_id': rule.get('id', 'unknown'),
+                    'bit': rule.get(RULE_BIT_KEY, 0)
                 })
     
     # if matched_rules:
@@ -82,58 +177,27 @@ def evaluate_mms_rule(row, rules, field, verbose=False):
         # Aggregate remaining matching rules
         result = aggregate_rule_results(filtered_matched_rules)
         result['rule_evaluations'] = rule_evaluations
-        return result
+    else:
+        # No rules matched - return None to indicate no change should be made
+        result = {'status': None, 'comment': '', 'rule_id': 'no_match', 'rule_evaluations': rule_evaluations}
+    # Applied rules are those aggregate_rule_results kept for the final status
+    applied_statuses = ('FAIL',) if result['status'] == 'FAIL' else ('FLAG', 'PASS')
+    applied_mask = 0
+    for rule_result in filtered_matched_rules:
+        if rule_result['status'] in applied_statuses:
+            applied_mask |= rule_result['bit']
+    result['trace'] = (met_mask, met_mask & skip_mask, applied_mask)
+    
+    if recorder is not None:
+        recorder.observe('qrate_rule_evaluation_seconds', time.perf_counter() - start, field=field)
+        for rule_result in filtered_matched_rules:
+            recorder.add('qrate_rule_hits_total', rule_id=rule_result['rule_id'], field=field)
     
-    # No rules matched - return None to indicate no change should be made
-    return {'status': None, 'comment': '', 'rule_id': 'no_match', 'rule_evaluations': rule_evaluations}
+    return result
 
 
-def clean_comment_duplicates(comments, status):
-    """Clean duplicate status prefixes from comments while preserving the first one."""
-    if not comments:
-        return ""
-    
-    # Define all possible prefix patterns to look for (not just the final status)
-    all_prefix_patterns = [
-        # "MMS103 FAIL",
-        # "MMS103 Manual FAIL", 
-        "MMS103 FLAG",
-        # "MMS103 Manual FLAG",
-        # "MMS103 PASS",
-        "MMS103 Manual PASS",
-        # "MMS109 FAIL",
-        # "MMS109 Manual FAIL",
-        "MMS109 FLAG", 
-        # "MMS109 Manual FLAG",
-        # "MMS109 PASS",
-        "MMS109 Manual PASS"
-    ]
-    
-    cleaned_comments = []
-    first_comment = True
-    
-    for comment in comments:
-        if first_comment:
-            # Keep the first comment as-is
-            cleaned_comments.append(comment)
-            first_comment = False
-        else:
-            # Remove any status prefixes from subsequent comments
-            cleaned_comment = comment
-            for pattern in all_prefix_patterns:
-                if cleaned_comment.startswith(pattern):
-                    # Remove the prefix and any following "as " or "due to "
-                    remaining = cleaned_comment[len(pattern):].strip()
-                    if remaining.startswith("as "):
-                        cleaned_comment = remaining
-                    elif remaining.startswith("due to "):
-                        cleaned_comment = remaining[7:]  # Remove "due to "
-                    else:
-                        cleaned_comment = remaining
-                    break
-            cleaned_comments.append(cleaned_comment)
-    
-    return '; '.join(cleaned_comments)
+# Aggregation priority of rule statuses; unknown statuses sort last
+STATUS_PRIORITY = {'FAIL': 0, 'FLAG': 1, 'PASS': 2}
 
 
 def aggregate_rule_results(matched_rules):
@@ -141,27 +205,31 @@ def aggregate_rule_results(matched_rules):
     If FAIL is present, only aggregate FAIL comments. Otherwise, aggregate FLAG and PASS comments in priority order.
     Clean duplicate status prefixes from comments.
     """
-    # Sort by priority: FAIL > FLAG > PASS
-    priority_order = {'FAIL': 0, 'FLAG': 1, 'PASS': 2}
-    sorted_rules = sorted(matched_rules, key=lambda x: priority_order.get(x['status'], 3))
-    final_status = sorted_rules[0]['status']
-
-    if final_status == 'FAIL':
-        # Only aggregate FAIL comments and rule_ids
-        comments = [rule['comment'] for rule in matched_rules if rule['status'] == 'FAIL' and rule['comment']]
-        rule_ids = [rule['rule_id'] for rule in matched_rules if rule['status'] == 'FAIL']
-    else:
-        # Aggregate FLAG and PASS comments in priority order
-        comments = [rule['comment'] for rule in sorted_rules if rule['status'] in ['FLAG', 'PASS'] and rule['comment']]
-        rule_ids = [rule['rule_id'] for rule in sorted_rules if rule['status'] in ['FLAG', 'PASS']]
+    # Group by priority in one pass, keeping rule order within each group
+    buckets = ([], [], [], [])
+    for rule in matched_rules:
+        buckets[STATUS_PRIORITY.get(rule['status'], 3)].append(rule)
+    final_status = next((bucket[0]['status'] for bucket in buckets if bucket), None)
+
+    # Only FAIL results count when anything failed, otherwise FLAG then PASS
+    selected = buckets[0] if final_status == 'FAIL' else buckets[1] + buckets[2]
 
-    # Clean duplicate prefixes from comments
-    combined_comment = clean_comment_duplicates(comments, final_status)
+    # Keep the first comment whole and use the prefix-free body of the rest
+    comments = []
+    for rule in selected:
+        comment = rule['comment']
+        if not comment:
+            continue
+        if comments:
+            body = rule.get('comment_body')
+            comments.append(body if body is not None else split_comment(comment, DEFAULT_COMMENT_PREFIXES)[1])
+        else:
+            comments.append(comment)
 
     return {
         'status': final_status,
-        'comment': combined_comment,
-        'rule_id': ','.join(rule_ids)
+        'comment': '; '.join(comments),
+        'rule_id': ','.join(rule['rule_id'] for rule in selected)
     }
 
 def determine_final_result(mms103_result, mms109_result, original_row):
@@ -222,27 +290,127 @@ def determine_final_result(mms103_result, mms109_result, original_row):
         'comment': final_comment
     }
 
+# Columns written by the engine, appended to the input columns when missing
+CURATED_FIELDS = ('MMS103', 'MMS109', 'TEST_QC', 'COMMENT')
+
 class CurationEngine:
-    def __init__(self, rules, verbose=False):
+    def __init__(self, rules, verbose=False, profiler=None, history=None,
+                 trace_column=False, trace_writer=None, shared_conditions=None):
         self.rules = rules
         self.verbose = verbose
+        self.profiler = profiler
+        self.history = history
+        self.trace_column = trace_column
+        self.trace_writer = trace_writer
+        self.shared_conditions = shared_conditions
+        self.check_conditions = self.check_compiled_conditions
+        self.rows_curated = 0
+        self.profiling_started = False
+        # Compiled conditions by id(rule), with the rule to detect reused ids
+        self._compiled = {}
+        # Batch results for the chunk being curated: id(rule) -> (rule, met per row)
+        self._batch_met = {}
+        self._batch_position = 0
+
+    def compiled_rule(self, rule):
+        entry = self._compiled.get(id(rule))
+        if entry is None or entry[0] is not rule:
+            entry = self._compiled[id(rule)] = (rule,) + compile_rule(rule)
+        return entry
+
+    def check_compiled_conditions(self, row, rule):
+        """Check a rule like check_rule_conditions, using batch results when available."""
+        batch = self._batch_met.get(id(rule))
+        if batch is not None and batch[0] is rule:
+            return batch[1][self._batch_position]
+        for check in self.compiled_rule(rule)[1]:
+            if not check(row):
+                return False
+        return True
+
+    def evaluate_batch(self, rows):
+        """Evaluate the conditions of every status rule over a chunk of rows."""
+        self._batch_met = {}
+        for rule in self.rules:
+            if has_field_action(rule, 'MMS103') or has_field_action(rule, 'MMS109'):
+                _, _, batches, signatures = self.compiled_rule(rule)
+                if self.shared_conditions is None:
+                    met = evaluate_rule_batch(rows, batches)
+                else:
+                    met = self.shared_conditions.rule_met(signatures, batches, rows)
+                self._batch_met[id(rule)] = (rule, met)
+
+    def start_profiling(self):
+        """Apply the learned condition order and profile the next rows."""
+        self.profiling_started = True
+        self.rules = self.profiler.learned_order(self.rules)
+        if self.profiler.sample_size > 0:
+            self.check_conditions = self.profiler.check_rule_conditions
+
+    def finish_profiling(self):
+        """Reorder conditions using the sampled rows and stop profiling."""
+        if self.check_conditions != self.check_compiled_conditions:
+            self.rules = self.profiler.reorder(self.rules)
+            self.check_conditions = self.check_compiled_conditions
 
     def curate_data(self, qc_data):
         processed_data = []
-        for row in qc_data:
-            if self.verbose:
-                curated_row, rule_details = self.curate_single_entry(row)
-                processed_data.append(curated_row)
-                self.log_curation_changes(row, curated_row, rule_details)
-            else:
-                curated_row = self.curate_single_entry(row)
-                processed_data.append(curated_row)
+        profiler = self.profiler
+        history = self.history
+        trace_writer = self.trace_writer
+        if profiler is not None and not self.profiling_started:
+            self.start_profiling()
+        rows = iter(qc_data)
+        with telemetry.span('curate_data'):
+            while True:
+                chunk = list(islice(rows, BATCH_SIZE))
+                if not chunk:
+                    break
+                # Rows being profiled are checked one at a time
+                if self.check_conditions == self.check_compiled_conditions:
+                    self.evaluate_batch(chunk)
+                try:
+                    for position, row in enumerate(chunk):
+                        self._batch_position = position
+                        # Profiling covers the first rows curated by this engine, even
+                        # when the data arrives over several curate_data calls
+                        if profiler is not None and self.rows_curated == profiler.sample_size:
+                            self.finish_profiling()
+                        curated_row, rule_details = self.curate_row(row)
+                        processed_data.append(curated_row)
+                        if history is not None:
+                            history.add(curated_row,
+                                        split_rule_ids(rule_details['mms103_rule_id']),
+                                        split_rule_ids(rule_details['mms109_rule_id']))
+                        if trace_writer is not None:
+                            trace_writer.add(row.get('ISOLATE', ''), rule_details['trace'])
+                        if self.verbose:
+                            self.log_curation_changes(row, curated_row, rule_details)
+                        self.rows_curated += 1
+                finally:
+                    self._batch_met = {}
+        if telemetry.active is not None:
+            telemetry.active.add('qrate_rows_total', len(processed_data), stage='curate')
         return processed_data
 
     def curate_single_entry(self, row):
-        mms103_result = evaluate_mms_rule(row, self.rules, 'MMS103', verbose=self.verbose)
-        mms109_result = evaluate_mms_rule(row, self.rules, 'MMS109', verbose=self.verbose)
+        result_row, final_result = self.curate_row(row)
+        if self.verbose:
+            return result_row, final_result
+        else:
+            return result_row
+
+    def curate_row(self, row):
+        """Curate a row and return it with the final result, including applied rule IDs."""
+        mms103_result = evaluate_mms_rule(row, self.rules, 'MMS103', verbose=self.verbose,
+                                          check_conditions=self.check_conditions)
+        mms109_result = evaluate_mms_rule(row, self.rules, 'MMS109', verbose=self.verbose,
+                                          check_conditions=self.check_conditions)
         final_result = determine_final_result(mms103_result, mms109_result, row)
+        final_result['mms103_rule_id'] = mms103_result['rule_id']
+        final_result['mms109_rule_id'] = mms109_result['rule_id']
+        # Rule bits are global to the ruleset, so both fields share one trace
+        final_result['trace'] = tuple(a | b for a, b in zip(mms103_result['trace'], mms109_result['trace']))
         
         # Store rule evaluations for verbose logging
         if self.verbose:
@@ -255,11 +423,10 @@ class CurationEngine:
         result_row['MMS109'] = final_result['mms109']
         result_row['TEST_QC'] = final_result['test_qc']
         result_row['COMMENT'] = final_result['comment']
+        if self.trace_column:
+            result_row[TRACE_COLUMN] = format_trace(*final_result['trace'])
         
-        if self.verbose:
-            return result_row, final_result
-        else:
-            return result_row
+        return result_row, final_result
 
     def log_curation_changes(self, original_row, curated_row, rule_details=None):
         """Log changes made during curation if verbose mode is enabled."""
@@ -0,0 +1,323 @@
+"""Differential testing of alternate curation engines against the reference.
+
+Every way of curating (the registry-based engine, compiled and batch
+condition checks, reordered conditions, adaptive ordering, traced,
+multi-profile or sharded runs, and any engine added later) must give exactly
+the results of the original engine, frozen in qrate.reference: the if/elif
+``evaluate_condition`` and sort-based comment aggregation over the raw rule
+dicts, including the quirks of skip_rules, FAIL propagation and keeping the
+original values when no rule matches. This module generates randomized QC rows from a ruleset, runs them
+through the reference and every alternate engine, and shrinks the first
+differing row to the smallest row that still differs.
+
+Values are drawn from the constants the rules compare against, numbers just
+either side of every threshold, names from the species mappings, and edge
+cases such as '-', empty cells, padded and boolean-ish strings and unknown
+species and schemes.
+"""
+
+import csv
+import os
+import random
+import shutil
+import tempfile
+from . import reference
+from .adaptive import ConditionProfiler
+from .curation_engine import CurationEngine, CURATED_FIELDS, check_rule_conditions
+from .operators import (
+    COMPARISON_OPERATORS, SPECIES_OPERATORS, OPERATOR_FIELDS, get_operator, load_mapping
+)
+from .profiles import MultiProfileEngine
+from .ruleset import optimize_rules
+from .sharding import curate_sharded
+
+DEFAULT_ROW_COUNT = 2000
+DEFAULT_SEED = 1
+
+EDGE_VALUES = ('', '-', ' ', 'True', 'False', 'true', 'false', 'TRUE', ' True', 'yes', '0', '1', 'NA', 'nan')
+STATUS_VALUES = ('PASS', 'FAIL', 'FLAG', '')
+COMMENT_VALUES = ('', 'original comment', 'FLAG carried over', 'MMS103 Manual PASS earlier review')
+SIZE_VALUES = ('3500000', '4000000', '4049999', '4050000', '4500000', '5000000', '5500000',
+               '6050000', '6050001', '7000000', '4.5e6')
+UNKNOWN_SPECIES = ('Unknownus bacterium', 'No identification', 'no identification', 'Salmonella', 'Escherichia')
+UNKNOWN_SCHEMES = ('unknown_scheme', 'SENTERICA_ACHTMAN_2')
+# Species sampled from each mapping file, enough to hit every relationship kind
+MAPPING_SAMPLE = 12
+# Simplest replacements tried for each cell when shrinking a differing row
+SHRINK_VALUES = ('', '-')
+
+
+def _species_names(rng):
+    """Species and scheme names from the mapping files, plus unknown ones."""
+    species = list(UNKNOWN_SPECIES)
+    schemes = list(UNKNOWN_SCHEMES)
+    for mapping_name, kind in (('species_scheme_mapping.yaml', 'scheme'),
+                               ('species_complex_mapping.yaml', 'complex'),
+                               ('species_synonym_mapping.yaml', 'synonym')):
+        try:
+            mapping = load_mapping(mapping_name)
+        except Exception:
+            continue
+        if not isinstance(mapping, dict):
+            continue
+        if kind == 'synonym':
+            pairs = list((mapping.get('synonyms') or {}).items())
+            for observed, expected in rng.sample(pairs, min(MAPPING_SAMPLE, len(pairs))):
+                species.extend([str(observed), str(expected)])
+            continue
+        keys = rng.sample(list(mapping), min(MAPPING_SAMPLE, len(mapping)))
+        for key in keys:
+            members = mapping[key] if isinstance(mapping[key], list) else [mapping[key]]
+            (schemes if kind == 'scheme' else species).append(str(key))
+            species.extend(str(member) for member in members[:3] if member is not None)
+    # Padded and subspecies variants exercise stripping and genus matching
+    species.extend([f" {species[-1]} ", f"{species[-2]} subsp. enterica", species[-3].split(' ')[0]])
+    return sorted(set(species)), sorted(set(schemes))
+
+
+def _numeric_values(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return []
+    values = {number, number - 1, number + 1, number - 0.01, number + 0.01, number / 2, number * 2}
+    values = [f"{v:g}" for v in values] + [str(int(number)) if number.is_integer() else str(number)]
+    return values + ['abc']
+
+
+def value_pools(rules, seed=DEFAULT_SEED):
+    """Build, for each column the rules read or write, the values rows are drawn from.
+
+    Args:
+        rules: Prepared ruleset
+        seed: Seed for sampling species names from the mappings
+
+    Returns:
+        Dictionary mapping column name to a list of candidate values
+    """
+    rng = random.Random(seed)
+    species, schemes = _species_names(rng)
+    pools = {}
+
+    def add(field, values):
+        pool = pools.setdefault(field, list(EDGE_VALUES))
+        pool.extend(str(value) for value in values if str(value) not in pool)
+
+    for rule in rules:
+        for condition in rule.get('conditions', []) or []:
+            field = condition.get('field')
+            operator = condition.get('operator')
+            value = condition.get('value')
+            registered = get_operator(operator)
+            if registered is not None and registered.numeric:
+                add(field, _numeric_values(value))
+            elif operator in COMPARISON_OPERATORS:
+                if isinstance(value, bool):
+                    add(field, [str(value), str(value).lower(), str(not value), str(not value).lower()])
+                else:
+                    add(field, [value, str(value).lower(), str(value).upper(), f" {value} "]
+                        + _numeric_values(value))
+            elif operator == 'contains':
+                add(field, [value, str(value).lower(), f"prefix {value} suffix", str(value)[:-1]])
+            elif operator == 'outside_pct':
+                for name in (field, condition.get('min_field'), condition.get('max_field')):
+                    add(name, SIZE_VALUES)
+            elif operator in SPECIES_OPERATORS:
+                add(field, species)
+            for name in OPERATOR_FIELDS.get(operator, ()):
+                add(name, schemes if name == 'SCHEME' else species)
+
+    for field in CURATED_FIELDS:
+        pools[field] = list(COMMENT_VALUES if field == 'COMMENT' else STATUS_VALUES)
+    return pools
+
+
+def generate_rows(pools, count, seed=DEFAULT_SEED):
+    """Generate count random rows drawing each column from its pool."""
+    rng = random.Random(seed)
+    fields = sorted(pools)
+    return [
+        dict({'ISOLATE': f"EQ-{index:06d}"}, **{field: rng.choice(pools[field]) for field in fields})
+        for index in range(count)
+    ]
+
+
+def reference_engine(rules):
+    """Reference semantics: the frozen original engine, one row at a time, rules in file order."""
+    rules = reference.raw_rules(rules)
+    return lambda rows: [reference.curate_single_entry(row, rules) for row in rows]
+
+
+def _registry_engine(rules):
+    engine = CurationEngine(rules)
+    engine.check_conditions = check_rule_conditions
+    return lambda rows: [engine.curate_single_entry(row) for row in rows]
+
+
+def _compiled_engine(rules):
+    engine = CurationEngine(rules)
+    return lambda rows: [engine.curate_single_entry(row) for row in rows]
+
+
+def _batch_engine(rules):
+    return CurationEngine(rules).curate_data
+
+
+def _optimized_engine(rules):
+    return CurationEngine(optimize_rules(rules)).curate_data
+
+
+def _adaptive_engine(rules):
+    # Profile a short prefix so the reordered rules handle most rows
+    return CurationEngine(rules, profiler=ConditionProfiler(sample_size=16)).curate_data
+
+
+def _traced_engine(rules):
+    return CurationEngine(rules, trace_column=True).curate_data
+
+
+def _profiles_engine(rules):
+    # The optimized profile reuses condition results of the file-order one
+    def run(rows):
+        engine = MultiProfileEngine([('file_order', rules), ('optimized', optimize_rules(rules))])
+        return engine.curate_data(rows)['optimized']
+    return run
+
+
+def _sharded_engine(rules):
+    def run(rows):
+        if not rows:
+            return []
+        directory = tempfile.mkdtemp(prefix='qrate-equivalence-')
+        try:
+            input_file = os.path.join(directory, 'input.csv')
+            output_file = os.path.join(directory, 'output.csv')
+            with open(input_file, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            curate_sharded(input_file, output_file, CurationEngine(rules),
+                           shard_size=max(1, len(rows) // 4), workers=2 if len(rows) > 1 else 1)
+            with open(output_file, 'r', newline='') as f:
+                return list(csv.DictReader(f))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return run
+
+
+# Alternate engines checked against the reference: name -> factory(rules)
+# returning a callable that curates a list of rows
+ALTERNATE_ENGINES = {
+    'registry': _registry_engine,
+    'compiled': _compiled_engine,
+    'batch': _batch_engine,
+    'optimized': _optimized_engine,
+    'adaptive': _adaptive_engine,
+    'traced': _traced_engine,
+    'profiles': _profiles_engine,
+    'sharded': _sharded_engine,
+}
+
+
+def diff_rows(expected, actual):
+    """Return [(column, expected, actual)] for the reference columns that differ."""
+    return [(field, value, actual.get(field)) for field, value in expected.items() if actual.get(field) != value]
+
+
+def shrink_row(row, differs):
+    """Blank cells of a differing row for as long as it keeps differing.
+
+    Args:
+        row: Row on which the engines disagree
+        differs: Callable returning True if the engines disagree on a row
+
+    Returns:
+        A row with as few non-empty cells as this greedy search finds
+    """
+    changed = True
+    while changed:
+        changed = False
+        for field in list(row):
+            for candidate in SHRINK_VALUES:
+                if row[field] == candidate:
+                    break
+                trial = dict(row)
+                trial[field] = candidate
+                if differs(trial):
+                    row = trial
+                    changed = True
+                    break
+    return row
+
+
+def check_engine(rules, rows, expected, name, factory):
+    """Compare one alternate engine with the reference results.
+
+    Returns:
+        Dictionary with the engine name, the number of differing rows and,
+        if any differ, the shrunk row and its differing columns
+    """
+    actual = factory(rules)([dict(row) for row in rows])
+    result = {'engine': name, 'rows': len(rows), 'mismatches': 0, 'minimal_row': None, 'differences': None}
+    if len(actual) != len(expected):
+        # Rows were dropped or duplicated, so they cannot be paired up
+        result['mismatches'] = len(rows)
+        return result
+
+    first = None
+    for row, expected_row, actual_row in zip(rows, expected, actual):
+        if diff_rows(expected_row, actual_row):
+            result['mismatches'] += 1
+            if first is None:
+                first = row
+    if first is None:
+        return result
+
+    def run_both(row):
+        reference = reference_engine(rules)([dict(row)])[0]
+        alternate = factory(rules)([dict(row)])
+        return reference, alternate[0] if alternate else {}
+
+    def differs(row):
+        return bool(diff_rows(*run_both(row)))
+
+    # A row may only differ in the context of the whole batch (e.g. profiling)
+    minimal = shrink_row(first, differs) if differs(first) else first
+    result['minimal_row'] = {field: value for field, value in minimal.items() if value != ''}
+    result['differences'] = diff_rows(*run_both(minimal))
+    return result
+
+
+def run_equivalence(rules, count=DEFAULT_ROW_COUNT, seed=DEFAULT_SEED, engines=None):
+    """Check alternate engines against the reference on generated rows.
+
+    Args:
+        rules: Prepared ruleset, in file order
+        count: Number of random rows to generate
+        seed: Random seed, so a failure can be reproduced
+        engines: Names of ALTERNATE_ENGINES to check (default: all)
+
+    Returns:
+        List of per-engine result dictionaries from check_engine
+    """
+    rows = generate_rows(value_pools(rules, seed), count, seed)
+    expected = reference_engine(rules)([dict(row) for row in rows])
+    return [check_engine(rules, rows, expected, name, ALTERNATE_ENGINES[name])
+            for name in (engines or ALTERNATE_ENGINES)]
+
+
+def format_report(results, seed):
+    """Format equivalence results for the terminal."""
+    lines = []
+    for result in results:
+        if not result['mismatches']:
+            lines.append(f"✓ {result['engine']}: {result['rows']} rows identical to reference")
+            continue
+        lines.append(f"✗ {result['engine']}: {result['mismatches']} of {result['rows']} rows differ (seed {seed})")
+        if result['minimal_row'] is not None:
+            lines.append("  Smallest differing row:")
+            for field, value in result['minimal_row'].items():
+                lines.append(f"    {field} = {value!r}")
+        for field, expected, actual in result['differences'] or []:
+            lines.append(f"  {field}: reference {expected!r}, {result['engine']} {actual!r}")
+    return '\n'.join(lines)
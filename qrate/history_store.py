@@ -0,0 +1,263 @@
+"""SQLite-backed history of curated QC rows.
+
+Each curation run can append its curated rows, together with the rule IDs
+that decided MMS103 and MMS109, to a local SQLite database. Rows are written
+in batched transactions and the tables are indexed by isolate, run, species
+and rule ID so questions across the whole history ("how many isolates of a
+species failed for low coverage this quarter") are answered without re-reading
+old ``.curated.csv`` files.
+
+A run is recorded as ``running`` when it starts and only marked ``finished``
+by finish_run once it succeeds. Closing a store with a run still in progress
+discards its queued rows and marks it ``failed``; rows of unfinished runs are
+left out of queries unless asked for, so an aborted run that is then repeated
+does not count its isolates twice.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+DEFAULT_BATCH_SIZE = 1000
+
+RUN_RUNNING = 'running'
+RUN_FINISHED = 'finished'
+RUN_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    input_file TEXT,
+    rules_file TEXT,
+    qrate_version TEXT,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS rows (
+    row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    isolate TEXT,
+    species_exp TEXT,
+    species_obs TEXT,
+    mms103 TEXT,
+    mms109 TEXT,
+    test_qc TEXT,
+    comment TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS row_rules (
+    row_id INTEGER NOT NULL REFERENCES rows(row_id),
+    run_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    rule_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rows_isolate ON rows(isolate);
+CREATE INDEX IF NOT EXISTS idx_rows_run ON rows(run_id);
+CREATE INDEX IF NOT EXISTS idx_rows_species_obs ON rows(species_obs);
+CREATE INDEX IF NOT EXISTS idx_rows_species_exp ON rows(species_exp);
+CREATE INDEX IF NOT EXISTS idx_row_rules_rule ON row_rules(rule_id, run_id);
+CREATE INDEX IF NOT EXISTS idx_row_rules_row ON row_rules(row_id);
+"""
+
+ROW_COLUMNS = ('isolate', 'species_exp', 'species_obs', 'mms103', 'mms109', 'test_qc', 'comment')
+
+
+def split_rule_ids(rule_id):
+    """Split the comma-joined rule_id of an evaluate_mms_rule result."""
+    if not rule_id or rule_id == 'no_match':
+        return []
+    return rule_id.split(',')
+
+
+class HistoryStore:
+    """Append curated rows to a SQLite history database in batches."""
+
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.run_id = None
+        self.row_count = 0
+        self._pending = []
+        self._running = False
+
+    def start_run(self, input_file=None, rules_file=None, version=None, started_at=None):
+        """Register a new, unfinished run and return its run_id."""
+        started_at = started_at or datetime.now().isoformat(timespec='seconds')
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, input_file, rules_file, qrate_version, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (started_at, input_file, rules_file, version, RUN_RUNNING)
+            )
+        self.run_id = cursor.lastrowid
+        self.row_count = 0
+        self._running = True
+        return self.run_id
+
+    def add(self, curated_row, mms103_rule_ids, mms109_rule_ids):
+        """Queue a curated row and the rules applied to it; flushes full batches."""
+        if self.run_id is None:
+            self.start_run()
+        self._pending.append((curated_row, mms103_rule_ids, mms109_rule_ids))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write queued rows in a single transaction."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with self.connection:
+            cursor = self.connection.cursor()
+            rule_rows = []
+            for row, mms103_rule_ids, mms109_rule_ids in pending:
+                cursor.execute(
+                    "INSERT INTO rows (run_id, isolate, species_exp, species_obs, mms103, mms109, "
+                    "test_qc, comment, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.run_id, row.get('ISOLATE'), row.get('SPECIES_EXP'), row.get('SPECIES_OBS'),
+                     row.get('MMS103'), row.get('MMS109'), row.get('TEST_QC'), row.get('COMMENT'),
+                     json.dumps(row))
+                )
+                row_id = cursor.lastrowid
+                rule_rows.extend((row_id, self.run_id, 'MMS103', rule_id) for rule_id in mms103_rule_ids)
+                rule_rows.extend((row_id, self.run_id, 'MMS109', rule_id) for rule_id in mms109_rule_ids)
+            cursor.executemany(
+                "INSERT INTO row_rules (row_id, run_id, field, rule_id) VALUES (?, ?, ?, ?)", rule_rows
+            )
+            self.row_count += len(pending)
+            cursor.execute("UPDATE runs SET row_count = ? WHERE run_id = ?", (self.row_count, self.run_id))
+
+    def _end_run(self, status):
+        finished_at = datetime.now().isoformat(timespec='seconds')
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET status = ?, finished_at = ?, row_count = ? WHERE run_id = ?",
+                (status, finished_at, self.row_count, self.run_id)
+            )
+        self._running = False
+
+    def finish_run(self):
+        """Write remaining rows and mark the run finished; call only when it succeeded."""
+        if not self._running:
+            return
+        self.flush()
+        self._end_run(RUN_FINISHED)
+
+    def abort_run(self):
+        """Discard queued rows and mark the run failed."""
+        self._pending = []
+        if self._running:
+            self._end_run(RUN_FAILED)
+
+    def close(self):
+        """Close the database, aborting a run that was not finished."""
+        try:
+            self.abort_run()
+        finally:
+            self.connection.close()
+
+
+def query_history(db_path, isolate=None, species=None, rule_id=None, run_id=None,
+                  status=None, since=None, until=None, limit=None, include_unfinished=False):
+    """Query curated rows from a history database.
+
+    Args:
+        db_path: Path to the SQLite history database
+        isolate: Exact ISOLATE to match
+        species: Species matched against SPECIES_OBS or SPECIES_EXP
+        rule_id: Only rows where this rule was applied
+        run_id: Only rows from this run
+        status: Only rows where MMS103, MMS109 or TEST_QC has this value
+        since: Only runs started on or after this ISO date
+        until: Only runs started before this ISO date
+        limit: Maximum number of rows to return
+        include_unfinished: Also return rows of failed or interrupted runs
+
+    Returns:
+        Tuple of (column names, list of result tuples)
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"History database '{db_path}' not found")
+
+    where = []
+    params = []
+    if isolate:
+        where.append("r.isolate = ?")
+        params.append(isolate)
+    if species:
+        where.append("(r.species_obs = ? OR r.species_exp = ?)")
+        params.extend([species, species])
+    if rule_id:
+        where.append("r.row_id IN (SELECT row_id FROM row_rules WHERE rule_id = ?)")
+        params.append(rule_id)
+    if run_id is not None:
+        where.append("r.run_id = ?")
+        params.append(run_id)
+    if status:
+        where.append("(r.mms103 = ? OR r.mms109 = ? OR r.test_qc = ?)")
+        params.extend([status, status, status])
+    if since:
+        where.append("u.started_at >= ?")
+        params.append(since)
+    if until:
+        where.append("u.started_at < ?")
+        params.append(until)
+
+    if not include_unfinished:
+        where.append("u.status = ?")
+        params.append(RUN_FINISHED)
+
+    sql = (
+        "SELECT r.run_id, u.started_at, r.isolate, r.species_exp, r.species_obs, r.mms103, r.mms109, "
+        "r.test_qc, r.comment, "
+        "(SELECT group_concat(rule_id, ',') FROM row_rules rr WHERE rr.row_id = r.row_id) AS rule_ids "
+        "FROM rows r JOIN runs u ON u.run_id = r.run_id"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY r.row_id"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = connection.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def list_runs(db_path, include_unfinished=False):
+    """Return (column names, rows) describing the runs in a history database.
+
+    Args:
+        db_path: Path to the SQLite history database
+        include_unfinished: Also list failed or interrupted runs
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"History database '{db_path}' not found")
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = ("SELECT run_id, started_at, finished_at, status, input_file, rules_file, qrate_version, row_count "
+               "FROM runs")
+        params = ()
+        if not include_unfinished:
+            sql += " WHERE status = ?"
+            params = (RUN_FINISHED,)
+        cursor = connection.execute(sql + " ORDER BY run_id", params)
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
+    finally:
+        connection.close()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
 import os
+import sqlite3
 import sys
 import yaml
 import pkg_resources
@@ -9,6 +11,20 @@ from datetime import datetime
 from .csv_handler import read_csv, write_csv
 from .curation_engine import CurationEngine
 from .species_checker import SpeciesChecker
+from .equivalence import run_equivalence, format_report, ALTERNATE_ENGINES, DEFAULT_ROW_COUNT, DEFAULT_SEED
+from .species_summary import summarize_species, format_summary, OUTPUT_FORMATS
+from .adaptive import ConditionProfiler, default_order_cache
+from .history_store import HistoryStore, query_history, list_runs
+from .watcher import watch_directory, DEFAULT_PATTERN, DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL
+from .sharding import curate_sharded, default_checkpoint_dir, read_fieldnames, CheckpointError, DEFAULT_SHARD_SIZE
+from .ruleset import (RulesetError, load_rules, optimize_rules, validate_rules, check_condition_fields,
+                      format_analysis, rule_legend)
+from .profiles import (MultiProfileEngine, ProfileError, parse_profile_spec, parse_profile_specs,
+                       profile_output_path, COLUMN_SEPARATOR as PROFILE_COLUMN_SEPARATOR)
+from .run_join import JoinError, DEFAULT_JOIN_KEY, check_sources, parse_join_spec, read_joined
+from .rule_trace import TraceWriter, TRACE_COLUMN, TRACE_FIELDS, decode_mask, legend_path, parse_trace, read_legend
+from . import telemetry
+from . import memory_report
 from . import __version__
 
 def log_with_timestamp(message, file=None):
@@ -36,8 +52,318 @@ def find_config_file(config_name):
         
         raise FileNotFoundError(f"Configuration file '{config_name}' not found")
 
-def main():
-    parser = argparse.ArgumentParser(description="QRate - QC data curation tool for bacterial genomics")
+def validate_command(argv):
+    """Validate a ruleset and print its static cost analysis."""
+    parser = argparse.ArgumentParser(
+        prog="qrate validate",
+        description="Validate a rules file and report estimated condition costs"
+    )
+    parser.add_argument("-r", "--rules", help="Path to rules YAML file (default: built-in rules.yaml)")
+    parser.add_argument("-i", "--input", help="QC CSV file whose header is checked against the fields rules read")
+    parser.add_argument("--join", action="append", metavar="NAME=PATH", default=[],
+                        help="Sheet joined onto the input, whose NAME.COLUMN fields rules may read (repeatable)")
+    args = parser.parse_args(argv)
+    if args.join and not args.input:
+        parser.error("--join needs -i/--input")
+    
+    rules_file = args.rules or find_config_file('rules.yaml')
+    try:
+        rules, issues = load_rules(rules_file, validate=False)
+    except FileNotFoundError as e:
+        log_with_timestamp(f"Error: Configuration file not found - {e}", file=sys.stderr)
+        return 1
+    except yaml.YAMLError as e:
+        log_with_timestamp(f"Error parsing YAML configuration: {e}", file=sys.stderr)
+        return 1
+    
+    if args.input:
+        try:
+            with open(args.input, 'r', newline='') as f:
+                fieldnames = next(csv.reader(f), [])
+            for source in join_sources(args.join):
+                fieldnames += source.joined_fieldnames()
+        except OSError as e:
+            log_with_timestamp(f"Error: Could not read input file - {e}", file=sys.stderr)
+            return 1
+        except JoinError as e:
+            log_with_timestamp(f"Error: {e}", file=sys.stderr)
+            return 1
+        issues = validate_rules(rules, fieldnames=fieldnames)
+    
+    print(f"Rules file: {rules_file}")
+    print(format_analysis(rules, issues))
+    return 1 if any(issue.severity == 'error' for issue in issues) else 0
+
+def join_sources(specs, key=DEFAULT_JOIN_KEY):
+    """Parse and check --join NAME=PATH arguments into JoinSource instances."""
+    sources = [parse_join_spec(spec, key) for spec in specs]
+    check_sources(sources)
+    return sources
+
+def query_command(argv):
+    """Query the curation history database."""
+    parser = argparse.ArgumentParser(
+        prog="qrate query",
+        description="Query curated rows recorded with --history-db"
+    )
+    parser.add_argument("db", help="Path to the SQLite history database")
+    parser.add_argument("--isolate", help="Only rows for this ISOLATE")
+    parser.add_argument("--species", help="Only rows where SPECIES_OBS or SPECIES_EXP is this species")
+    parser.add_argument("--rule", help="Only rows where this rule ID was applied")
+    parser.add_argument("--run", type=int, help="Only rows from this run ID")
+    parser.add_argument("--status", choices=["FAIL", "FLAG", "PASS"], help="Only rows with this MMS103, MMS109 or TEST_QC value")
+    parser.add_argument("--since", help="Only runs started on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="Only runs started before this date (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, help="Maximum number of rows to print")
+    parser.add_argument("--count", action="store_true", help="Print the number of matching rows and distinct isolates only")
+    parser.add_argument("--runs", action="store_true", help="List recorded runs instead of rows")
+    parser.add_argument("--include-unfinished", action="store_true",
+                        help="Include runs that failed or were interrupted before finishing")
+    args = parser.parse_args(argv)
+    
+    try:
+        if args.runs:
+            columns, rows = list_runs(args.db, include_unfinished=args.include_unfinished)
+        else:
+            columns, rows = query_history(
+                args.db, isolate=args.isolate, species=args.species, rule_id=args.rule,
+                run_id=args.run, status=args.status, since=args.since, until=args.until,
+                limit=None if args.count else args.limit, include_unfinished=args.include_unfinished
+            )
+    except FileNotFoundError as e:
+        log_with_timestamp(f"Error: {e}", file=sys.stderr)
+        return 1
+    except sqlite3.Error as e:
+        log_with_timestamp(f"Error querying history database: {e}", file=sys.stderr)
+        return 1
+    
+    if args.count and not args.runs:
+        isolate_index = columns.index('isolate')
+        print(f"rows: {len(rows)}")
+        print(f"isolates: {len(set(row[isolate_index] for row in rows))}")
+        return 0
+    
+    writer = csv.writer(sys.stdout)
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return 0
+
+def watch_command(argv):
+    """Curate QC sheets as they are written below a directory."""
+    parser = argparse.ArgumentParser(
+        prog="qrate watch",
+        description="Watch a directory tree and curate QC sheets as they land"
+    )
+    parser.add_argument("directory", help="Directory to watch (including subdirectories)")
+    parser.add_argument("-r", "--rules", help="Path to rules YAML file (default: built-in rules.yaml)")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help=f"File name pattern to curate (default: {DEFAULT_PATTERN})")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help=f"Seconds without writes before a file is curated (default: {DEFAULT_DEBOUNCE})")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"Seconds between scans when polling (default: {DEFAULT_POLL_INTERVAL})")
+    parser.add_argument("--polling", action="store_true", help="Poll the directory instead of using inotify")
+    parser.add_argument("--existing", action="store_true", help="Also curate matching files already present at startup")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.directory):
+        log_with_timestamp(f"Error: Directory not found - {args.directory}", file=sys.stderr)
+        return 1
+    
+    rules_file = args.rules or find_config_file('rules.yaml')
+    try:
+        rules, _ = load_rules(rules_file)
+    except FileNotFoundError as e:
+        log_with_timestamp(f"Error: Configuration file not found - {e}", file=sys.stderr)
+        return 1
+    except (yaml.YAMLError, RulesetError) as e:
+        log_with_timestamp(f"Error: Invalid rules file {rules_file} - {e}", file=sys.stderr)
+        return 1
+    rules = optimize_rules(rules)
+    
+    def curate_landed_file(path, landed_at):
+        base, ext = os.path.splitext(path)
+        output = f"{base}.curated{ext}"
+        started = datetime.now().timestamp()
+        try:
+            for issue in check_condition_fields(rules, read_fieldnames(path)):
+                log_with_timestamp(f"Warning: {path}: {issue}", file=sys.stderr)
+            qc_data = read_csv(path)
+            processed_data = CurationEngine(rules).curate_data(qc_data)
+            write_csv(processed_data, output)
+        except Exception as e:
+            log_with_timestamp(f"Error processing {path}: {e}", file=sys.stderr)
+            return
+        finished = datetime.now().timestamp()
+        log_with_timestamp(
+            f"Curated {len(qc_data)} records from {path} -> {output} "
+            f"(processing {finished - started:.2f}s, latency since landing {finished - landed_at:.2f}s)"
+        )
+    
+    log_with_timestamp(f"Loading rules from: {rules_file}")
+    log_with_timestamp(f"Watching {args.directory} for '{args.pattern}' (Ctrl-C to stop)")
+    try:
+        watch_directory(
+            args.directory, curate_landed_file, pattern=args.pattern, debounce=args.debounce,
+            poll_interval=args.poll_interval, use_inotify=not args.polling,
+            process_existing=args.existing
+        )
+    except KeyboardInterrupt:
+        log_with_timestamp("Stopped watching")
+    return 0
+
+def trace_command(argv):
+    """Expand rule traces into the rule IDs met, skipped and applied per row."""
+    parser = argparse.ArgumentParser(
+        prog="qrate trace",
+        description="Decode the RULE_TRACE column of a curated CSV or a --trace-file sidecar"
+    )
+    parser.add_argument("trace_file", help="Curated CSV written with --trace, or sidecar written with --trace-file")
+    parser.add_argument("-r", "--rules", help="Rules YAML used for the run, to decode a RULE_TRACE column "
+                                              "(default: built-in rules.yaml)")
+    parser.add_argument("--column", help=f"Trace column to decode (default: {TRACE_COLUMN})")
+    parser.add_argument("--profile", metavar="NAME=RULES",
+                        help=f"Decode the NAME.{TRACE_COLUMN} column of a --profile-columns output with that "
+                             f"profile's rules")
+    parser.add_argument("--isolate", help="Only decode rows for this ISOLATE")
+    args = parser.parse_args(argv)
+    
+    column = args.column or TRACE_COLUMN
+    rules_file = args.rules
+    if args.profile:
+        if args.rules or args.column:
+            parser.error("--profile cannot be combined with -r/--rules or --column")
+        try:
+            name, rules_file = parse_profile_spec(args.profile)
+        except ProfileError as e:
+            parser.error(str(e))
+        column = name + PROFILE_COLUMN_SEPARATOR + TRACE_COLUMN
+    
+    try:
+        with open(args.trace_file, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            if column in fieldnames:
+                legend = rule_legend(load_rules(rules_file or find_config_file('rules.yaml'), validate=False)[0])
+            elif column == TRACE_COLUMN and all(field in fieldnames for field in TRACE_FIELDS):
+                legend = read_legend(legend_path(args.trace_file))
+            else:
+                log_with_timestamp(f"Error: {args.trace_file} has no {column} column and is not a trace sidecar",
+                                   file=sys.stderr)
+                return 1
+            
+            writer = csv.writer(sys.stdout)
+            writer.writerow(TRACE_FIELDS)
+            for row in reader:
+                if args.isolate and row.get('ISOLATE') != args.isolate:
+                    continue
+                if column in fieldnames:
+                    masks = parse_trace(row[column])
+                else:
+                    masks = [int(row[field], 16) for field in TRACE_FIELDS[1:]]
+                writer.writerow([row.get('ISOLATE', '')] + [';'.join(decode_mask(mask, legend)) for mask in masks])
+    except OSError as e:
+        log_with_timestamp(f"Error: Could not read trace - {e}", file=sys.stderr)
+        return 1
+    except (yaml.YAMLError, ValueError, KeyError) as e:
+        log_with_timestamp(f"Error decoding trace: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+def species_command(argv):
+    """Count species across many or large QC sheets without curating them."""
+    parser = argparse.ArgumentParser(
+        prog="qrate species",
+        description="Stream QC sheets (plain, .gz, .bz2 or .xz) and count samples per species"
+    )
+    parser.add_argument("files", nargs='+', help="QC CSV files to summarize")
+    parser.add_argument("-s", "--species", action="append", default=[],
+                        help="Also count this species (repeatable)")
+    parser.add_argument("--species-file", help="File listing additional species to count, one per line")
+    parser.add_argument("--species-recommendations",
+                        help="YAML mapping whose species are counted (default: built-in species_recommendations.yaml)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Count byte ranges of large files in this many worker processes")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text", help="Output format (default: text)")
+    args = parser.parse_args(argv)
+    
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
+    try:
+        species_list = list(SpeciesChecker(args.species_recommendations).species_list)
+    except (OSError, yaml.YAMLError) as e:
+        log_with_timestamp(f"Error: Could not load species recommendations - {e}", file=sys.stderr)
+        return 1
+    extra_species = list(args.species)
+    if args.species_file:
+        try:
+            with open(args.species_file, 'r') as f:
+                extra_species.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        except OSError as e:
+            log_with_timestamp(f"Error: Could not read species file - {e}", file=sys.stderr)
+            return 1
+    species_list.extend(species for species in extra_species if species not in species_list)
+    
+    try:
+        with telemetry.span('species_summary', files=len(args.files), workers=args.workers):
+            per_file, total = summarize_species(args.files, species_list, workers=args.workers)
+    except OSError as e:
+        log_with_timestamp(f"Error reading QC file: {e}", file=sys.stderr)
+        return 1
+    
+    print(format_summary(per_file, total, args.format))
+    return 0
+
+def equivalence_command(argv):
+    """Check that alternate curation engines match the reference results."""
+    parser = argparse.ArgumentParser(
+        prog="qrate equivalence",
+        description="Curate randomized QC rows with the reference engine and every alternate engine, "
+                    "and report the smallest row on which they disagree"
+    )
+    parser.add_argument("-r", "--rules", help="Path to rules YAML file (default: built-in rules.yaml)")
+    parser.add_argument("-n", "--rows", type=int, default=DEFAULT_ROW_COUNT,
+                        help=f"Number of random rows to generate (default: {DEFAULT_ROW_COUNT})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help=f"Random seed (default: {DEFAULT_SEED})")
+    parser.add_argument("--engine", action="append", choices=sorted(ALTERNATE_ENGINES),
+                        help="Only check this alternate engine (repeatable; default: all)")
+    args = parser.parse_args(argv)
+    
+    rules_file = args.rules or find_config_file('rules.yaml')
+    try:
+        rules, _ = load_rules(rules_file)
+    except FileNotFoundError as e:
+        log_with_timestamp(f"Error: Configuration file not found - {e}", file=sys.stderr)
+        return 1
+    except (yaml.YAMLError, RulesetError) as e:
+        log_with_timestamp(f"Error: Invalid rules file {rules_file} - {e}", file=sys.stderr)
+        return 1
+    
+    log_with_timestamp(f"Checking {args.rows} random rows against {rules_file} (seed {args.seed})")
+    results = run_equivalence(rules, count=args.rows, seed=args.seed, engines=args.engine)
+    print(format_report(results, args.seed))
+    return 1 if any(result['mismatches'] for result in results) else 0
+
+# Subcommands dispatched on the first argument; anything else is an input file
+COMMANDS = {
+    'validate': validate_command,
+    'query': query_command,
+    'watch': watch_command,
+    'trace': trace_command,
+    'species': species_command,
+    'equivalence': equivalence_command,
+}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    
+    parser = argparse.ArgumentParser(
+        description="QRate - QC data curation tool for bacterial genomics",
+        epilog="Other commands: " + ", ".join(f"qrate {name}" for name in COMMANDS)
+    )
     parser.add_argument("input_file", nargs='?', help="Path to input CSV file")
     parser.add_argument("-o", "--output", help="Path to output CSV file (default: input file with .curated suffix)")
     default_rules_path = find_config_file('rules.yaml')
@@ -45,68 +371,277 @@ def main():
         "-r", "--rules",
         help=f"Path to rules YAML file (default: {default_rules_path})"
     )
+    parser.add_argument(
+        "--profile", action="append", metavar="NAME=RULES", default=[],
+        help="Curate with this rules file as profile NAME; several profiles are curated in one pass, "
+             "writing <output>.NAME.csv each (repeatable, replaces -r)"
+    )
+    parser.add_argument(
+        "--profile-columns", action="store_true",
+        help="With --profile, write one output with NAME.MMS103, NAME.MMS109, NAME.TEST_QC and NAME.COMMENT "
+             "columns for every profile"
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
     parser.add_argument("-c","--check-species", action="store_true", help="Check species counts and provide file expectations after limisfy QC step")
+    parser.add_argument("--run-dir", help="Run directory checked for expected files with --check-species "
+                                          "(default: directory of the input file)")
+    parser.add_argument(
+        "--species-recommendations",
+        help="YAML mapping of species to expected typing files (default: built-in species_recommendations.yaml)"
+    )
+    parser.add_argument(
+        "--keep-condition-order", action="store_true",
+        help="Evaluate rule conditions in YAML order instead of the cost-optimized order"
+    )
+    parser.add_argument(
+        "--adaptive-order", type=int, metavar="N", nargs='?', const=200,
+        help="Profile conditions on the first N rows (default: 200) and reorder them by observed "
+             "selectivity for the rest of the run; the learned order is reused by later runs"
+    )
+    parser.add_argument(
+        "--order-cache",
+        help=f"File storing the learned condition order (default: {default_order_cache()})"
+    )
+    parser.add_argument(
+        "--shard-size", type=int, metavar="ROWS",
+        help="Curate in shards of ROWS rows, checkpointing each finished shard so an interrupted "
+             "run resumes where it stopped"
+    )
+    parser.add_argument("--checkpoint-dir", help="Directory for shard checkpoints (default: <output>.shards)")
+    parser.add_argument("--keep-shards", action="store_true", help="Keep the checkpoint directory after the output is assembled")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1,
+        help=f"Curate shards in this many worker processes (implies --shard-size {DEFAULT_SHARD_SIZE} if not set)"
+    )
+    parser.add_argument(
+        "--trace", action="store_true",
+        help=f"Add a {TRACE_COLUMN} column recording the rules met, skipped and applied per row (decode with 'qrate trace')"
+    )
+    parser.add_argument("--trace-file", help="Write per-row rule traces to this sidecar CSV, with a .rules.csv legend")
+    parser.add_argument(
+        "--join", action="append", metavar="NAME=PATH", default=[],
+        help="Join this run sheet (e.g. NTC=ntc.csv) onto the input by isolate so rules can read its "
+             "columns as NAME.COLUMN (repeatable)"
+    )
+    parser.add_argument("--join-key", default=DEFAULT_JOIN_KEY,
+                        help=f"Column matched between the input and the joined sheets (default: {DEFAULT_JOIN_KEY})")
+    parser.add_argument("--join-sorted", action="store_true",
+                        help="The input and joined sheets are sorted by the join key: stream the joined sheets "
+                             "with a merge join instead of loading them into memory (the QC sheet is still read whole)")
+    parser.add_argument("--keep-joined", action="store_true", help="Write the joined NAME.COLUMN columns to the output")
+    parser.add_argument("--history-db", help="Append curated rows and applied rule IDs to this SQLite database")
+    parser.add_argument("--metrics-file", help="Enable instrumentation and write spans/metrics to this file at the end of the run")
+    parser.add_argument(
+        "--metrics-format", choices=telemetry.EXPORT_FORMATS, default="prometheus",
+        help="Format for --metrics-file: Prometheus textfile or OTLP JSON (default: prometheus)"
+    )
+    parser.add_argument(
+        "--mem-report", action="store_true",
+        help="Trace allocations and report peak memory, allocations and bytes per row for each stage"
+    )
+    parser.add_argument("--mem-history", help="Append the --mem-report results to this JSON-lines file "
+                                              "and compare with the previous run on the same input")
+    parser.add_argument("--mem-top-sites", action="store_true",
+                        help="With --mem-report, also list the source lines that allocated the most in each stage "
+                             "(snapshots every stage; slow and memory-hungry on large inputs)")
     parser.add_argument("--version", action="version", version=f"QRate {__version__}")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Check if input file is provided (required unless --version is used)
     if not args.input_file:
         parser.error("the following arguments are required: input_file")
     
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.shard_size is not None and args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    if args.workers > 1:
+        if args.verbose or args.history_db or args.adaptive_order is not None:
+            parser.error("--workers cannot be combined with --verbose, --history-db or --adaptive-order")
+        if args.shard_size is None:
+            args.shard_size = DEFAULT_SHARD_SIZE
+    if args.history_db and args.shard_size is not None:
+        # Shards reused from a checkpoint would never be recorded in the resumed run
+        parser.error("--history-db cannot be combined with --shard-size")
+    if args.trace_file and args.shard_size is not None:
+        parser.error("--trace-file cannot be combined with --shard-size or --workers; use --trace instead")
+    if args.join and args.shard_size is not None:
+        parser.error("--join cannot be combined with --shard-size or --workers")
+    profiles = []
+    if args.profile:
+        if args.rules:
+            parser.error("--profile cannot be combined with -r/--rules")
+        if (args.verbose or args.adaptive_order is not None or args.history_db or args.trace_file
+                or args.shard_size is not None):
+            parser.error("--profile cannot be combined with --verbose, --adaptive-order, --history-db, "
+                         "--trace-file, --shard-size or --workers")
+        try:
+            profiles = parse_profile_specs(args.profile)
+        except ProfileError as e:
+            parser.error(str(e))
+    elif args.profile_columns:
+        parser.error("--profile-columns needs --profile")
+    
     # Set default output file if not provided
     if not args.output:
         base, ext = os.path.splitext(args.input_file)
         args.output = f"{base}.curated{ext}"
     
     # Find rules configuration file
-    rules_file = args.rules
-    if not rules_file:
-        try:
-            rules_file = find_config_file('rules.yaml')
-        except FileNotFoundError:
-            log_with_timestamp("Error: No rules file specified and default 'rules.yaml' not found", file=sys.stderr)
-            log_with_timestamp("Please specify a rules file with -r/--rules or ensure 'rules.yaml' exists", file=sys.stderr)
-            return 1
+    if profiles:
+        rules_files = [profile_rules for _, profile_rules in profiles]
+    else:
+        rules_file = args.rules
+        if not rules_file:
+            try:
+                rules_file = find_config_file('rules.yaml')
+            except FileNotFoundError:
+                log_with_timestamp("Error: No rules file specified and default 'rules.yaml' not found", file=sys.stderr)
+                log_with_timestamp("Please specify a rules file with -r/--rules or ensure 'rules.yaml' exists", file=sys.stderr)
+                return 1
+        rules_files = [rules_file]
     
     # Load rules configuration
+    rulesets = []
+    for rules_file in rules_files:
+        rules = load_checked_rules(rules_file, verbose=args.verbose)
+        if rules is None:
+            return 1
+        rulesets.append(rules)
+    
     try:
-        with open(rules_file, 'r') as f:
-            rules = yaml.safe_load(f)
-        if not args.verbose:
-            log_with_timestamp(f"Loading rules from: {rules_file}")
-    except FileNotFoundError as e:
-        log_with_timestamp(f"Error: Configuration file not found - {e}", file=sys.stderr)
-        return 1
-    except yaml.YAMLError as e:
-        log_with_timestamp(f"Error parsing YAML configuration: {e}", file=sys.stderr)
+        sources = join_sources(args.join, args.join_key)
+    except (OSError, JoinError) as e:
+        log_with_timestamp(f"Error: Could not join run sheets - {e}", file=sys.stderr)
         return 1
     
+    if not args.keep_condition_order:
+        rulesets = [optimize_rules(rules) for rules in rulesets]
+    rules = rulesets[0]
+    
+    if args.metrics_file:
+        recorder = telemetry.enable()
+        recorder.set_gauge('qrate_run_info', 1, input=args.input_file, rules=','.join(rules_files), version=__version__)
+    if args.mem_report or args.mem_history or args.mem_top_sites:
+        memory_report.enable(top_sites=args.mem_top_sites)
+    
     # Process QC data
+    history = None
+    trace_writer = None
     try:
         if not args.verbose:
             log_with_timestamp(f"Reading input file: {args.input_file}")
         
-        qc_data = read_csv(args.input_file)
+        # A condition on a column the input lacks is never met; warn before curating
+        fieldnames = read_fieldnames(args.input_file)
+        for source in sources:
+            fieldnames += source.joined_fieldnames()
+        for ruleset_file, ruleset in zip(rules_files, rulesets):
+            for issue in check_condition_fields(ruleset, fieldnames):
+                prefix = f"{ruleset_file}: " if len(rulesets) > 1 else ""
+                log_with_timestamp(f"Warning: {prefix}{issue}", file=sys.stderr)
         
-        if not args.verbose:
-            log_with_timestamp(f"Processing {len(qc_data)} records...")
+        if args.shard_size is None:
+            with memory_report.stage('read') as usage:
+                qc_data = read_csv(args.input_file)
+                usage.rows = len(qc_data)
+            
+            if sources:
+                with memory_report.stage('join') as usage:
+                    qc_data = read_joined(qc_data, sources, args.join_key, args.join_sorted)
+                    usage.rows = len(qc_data)
+                if not args.verbose:
+                    for source in sources:
+                        log_with_timestamp(f"Joined {source.path} as {source.summary()}")
+            
+            if not args.verbose:
+                log_with_timestamp(f"Processing {len(qc_data)} records...")
         
         # Initialize curation engine
-        curation_engine = CurationEngine(rules, verbose=args.verbose)
+        profiler = None
+        if args.adaptive_order is not None:
+            profiler = ConditionProfiler(args.adaptive_order, args.order_cache or default_order_cache())
+        if args.history_db:
+            history = HistoryStore(args.history_db)
+            history.start_run(input_file=os.path.abspath(args.input_file),
+                              rules_file=os.path.abspath(rules_file), version=__version__)
+        if args.trace_file:
+            trace_writer = TraceWriter(args.trace_file, rules)
+        if profiles:
+            curation_engine = MultiProfileEngine([(name, profile_rules) for (name, _), profile_rules
+                                                  in zip(profiles, rulesets)], trace_column=args.trace)
+        else:
+            curation_engine = CurationEngine(rules, verbose=args.verbose, profiler=profiler, history=history,
+                                             trace_column=args.trace, trace_writer=trace_writer)
         
         # Apply curation logic
-        processed_data = curation_engine.curate_data(qc_data)
+        if profiles:
+            # One read, every profile curated chunk by chunk with shared conditions
+            with memory_report.stage('curate') as usage:
+                profile_data = curation_engine.curate_data(qc_data)
+                usage.rows = record_count = len(qc_data)
+        elif args.shard_size is None:
+            with memory_report.stage('curate') as usage:
+                processed_data = curation_engine.curate_data(qc_data)
+                usage.rows = record_count = len(qc_data)
+        else:
+            checkpoint_dir = args.checkpoint_dir or default_checkpoint_dir(args.output)
+            if not args.verbose:
+                log_with_timestamp(f"Processing in shards of {args.shard_size} records "
+                                   f"(checkpoints in {checkpoint_dir})...")
+            # Sharded runs read, curate and write in one stage
+            with memory_report.stage('curate') as usage:
+                shard_stats = curate_sharded(
+                    args.input_file, args.output, curation_engine, shard_size=args.shard_size,
+                    checkpoint_dir=checkpoint_dir, workers=args.workers, keep_shards=args.keep_shards
+                )
+                usage.rows = record_count = shard_stats['rows']
+            if shard_stats['reused'] and not args.verbose:
+                log_with_timestamp(f"Resumed: reused {shard_stats['reused']} of {shard_stats['shards']} "
+                                   f"shards from an earlier run")
         
-        write_csv(processed_data, args.output)
+        if trace_writer is not None:
+            trace_writer.close()
+            trace_writer = None
+            if not args.verbose:
+                log_with_timestamp(f"Rule traces written to: {args.trace_file}")
+        
+        if profiler is not None:
+            try:
+                profiler.save()
+            except OSError as e:
+                log_with_timestamp(f"Warning: Could not save learned condition order - {e}", file=sys.stderr)
+        
+        output_files = [args.output]
+        if args.shard_size is None:
+            if not profiles:
+                outputs = [(args.output, processed_data)]
+            elif args.profile_columns:
+                outputs = [(args.output, curation_engine.combine(qc_data, profile_data))]
+            else:
+                outputs = [(profile_output_path(args.output, name), profile_data[name]) for name, _ in profiles]
+            with memory_report.stage('write') as usage:
+                for output_file, data in outputs:
+                    write_csv(data, output_file, fieldnames=output_fieldnames(data, sources, args.keep_joined))
+                usage.rows = sum(len(data) for _, data in outputs)
+            output_files = [output_file for output_file, _ in outputs]
+        
+        # Only a run whose output was written is recorded as finished
+        if history is not None:
+            history.finish_run()
+            history.close()
+            history = None
+            if not args.verbose:
+                log_with_timestamp(f"History recorded in: {args.history_db}")
         
         if not args.verbose:
-            log_with_timestamp(f"Output written to: {args.output}")
+            for output_file in output_files:
+                log_with_timestamp(f"Output written to: {output_file}")
             log_with_timestamp("Processing completed successfully!")
         elif args.verbose:
             log_with_timestamp(f"\nSUMMARY:")
-            log_with_timestamp(f"Processed {len(qc_data)} records")
+            log_with_timestamp(f"Processed {record_count} records")
             log_with_timestamp(f"Output written to {args.output}")
         
         # Run species checking if requested
@@ -116,8 +651,11 @@ def main():
                 print("SPECIES ANALYSIS")
                 print(f"{'='*50}")
             
-            species_checker = SpeciesChecker()
-            species_success = species_checker.check_species(args.input_file, verbose=args.verbose)
+            with memory_report.stage('species') as usage:
+                species_checker = SpeciesChecker(args.species_recommendations)
+                species_success = species_checker.check_species(args.input_file, verbose=args.verbose,
+                                                                run_dir=args.run_dir)
+                usage.rows = record_count
             
             if not species_success:
                 log_with_timestamp("Warning: Species checking encountered errors", file=sys.stderr)
@@ -125,11 +663,106 @@ def main():
     except FileNotFoundError as e:
         log_with_timestamp(f"Error: Input file not found - {e}", file=sys.stderr)
         return 1
+    except JoinError as e:
+        log_with_timestamp(f"Error: Could not join run sheets - {e}", file=sys.stderr)
+        return 1
+    except CheckpointError as e:
+        log_with_timestamp(f"Error: Cannot use checkpoint directory - {e}", file=sys.stderr)
+        return 1
     except Exception as e:
         log_with_timestamp(f"Error processing QC data: {e}", file=sys.stderr)
         return 1
+    finally:
+        if history is not None:
+            # Not finished: the run is marked failed and its queued rows discarded
+            history.close()
+        if trace_writer is not None:
+            trace_writer.close()
+        if args.metrics_file:
+            export_metrics(args.metrics_file, args.metrics_format)
+        if memory_report.active is not None:
+            report_memory(args.mem_history, input=os.path.abspath(args.input_file),
+                          rules=','.join(os.path.abspath(rules_file) for rules_file in rules_files),
+                          version=__version__)
     
     return 0
 
+def load_checked_rules(rules_file, verbose=False):
+    """Load and validate a rules file for a run, logging any problems.
+    
+    Returns:
+        The prepared rules, or None if they could not be loaded
+    """
+    try:
+        rules, issues = load_rules(rules_file)
+        if not verbose:
+            log_with_timestamp(f"Loading rules from: {rules_file}")
+    except FileNotFoundError as e:
+        log_with_timestamp(f"Error: Configuration file not found - {e}", file=sys.stderr)
+        return None
+    except yaml.YAMLError as e:
+        log_with_timestamp(f"Error parsing YAML configuration: {e}", file=sys.stderr)
+        return None
+    except RulesetError as e:
+        log_with_timestamp(f"Error: Invalid rules file {rules_file}", file=sys.stderr)
+        for issue in e.issues:
+            log_with_timestamp(f"  {issue.severity.upper()}: {issue}", file=sys.stderr)
+        log_with_timestamp("Run 'qrate validate -r <rules>' for the full analysis", file=sys.stderr)
+        return None
+    
+    for issue in issues:
+        log_with_timestamp(f"Warning: {issue}", file=sys.stderr)
+    return rules
+
+def output_fieldnames(data, sources, keep_joined=False):
+    """Output columns for curated rows, leaving out joined columns unless keep_joined."""
+    if not sources or not data:
+        return None
+    joined = [field for source in sources for field in source.joined_fieldnames()]
+    excluded = set(joined)
+    fieldnames = [field for field in data[0] if field not in excluded]
+    return fieldnames + joined if keep_joined else fieldnames
+
+def report_memory(history_file, **metadata):
+    """Print the active memory report, optionally record it, and stop tracing."""
+    report = memory_report.active
+    try:
+        print(f"\n{report.format()}")
+        if history_file:
+            try:
+                previous = report.append_history(history_file, **metadata)
+                log_with_timestamp(f"Memory report appended to: {history_file}")
+                if previous is not None:
+                    print(report.format_comparison(previous))
+            except OSError as e:
+                log_with_timestamp(f"Warning: Could not write memory history - {e}", file=sys.stderr)
+    finally:
+        memory_report.disable()
+
+def export_metrics(metrics_file, metrics_format):
+    """Write the active run's telemetry and disable instrumentation."""
+    recorder = telemetry.active
+    if recorder is None:
+        return
+    
+    # Sharded runs record one curate_data span per shard, or one curate_sharded span
+    curate_spans = [s for s in recorder.spans if s['name'] == 'curate_sharded']
+    if not curate_spans:
+        curate_spans = [s for s in recorder.spans if s['name'] == 'curate_data']
+    rows = recorder.counters.get('qrate_rows_total', {}).get((('stage', 'curate'),), 0)
+    if curate_spans and rows:
+        seconds = sum(s['end_ns'] - s['start_ns'] for s in curate_spans) / 1e9
+        if seconds > 0:
+            recorder.set_gauge('qrate_run_rows_per_second', rows / seconds)
+    recorder.set_gauge('qrate_run_timestamp_seconds', round(datetime.now().timestamp(), 3))
+    
+    try:
+        recorder.export(metrics_file, metrics_format)
+        log_with_timestamp(f"Metrics written to: {metrics_file}")
+    except OSError as e:
+        log_with_timestamp(f"Warning: Could not write metrics file - {e}", file=sys.stderr)
+    finally:
+        telemetry.disable()
+
 if __name__ == "__main__":
     sys.exit(main())
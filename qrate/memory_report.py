@@ -0,0 +1,242 @@
+"""Per-stage memory reporting for QRate runs.
+
+With ``--mem-report`` the run is traced with tracemalloc and every stage
+(read, join, curate, write, species) records the peak traced memory above what was
+allocated when it started, the memory it left allocated, the net number of
+allocated blocks and the process maximum RSS from getrusage. Dividing by the
+stage's row count gives bytes per row, which is what decides whether a larger
+input will fit.
+
+Stages are measured with get_traced_memory and reset_peak only. Listing the
+source lines that allocated the most needs two full tracemalloc snapshots per
+stage, which on a large input take more memory and time than the run itself,
+so it is a separate opt-in (``--mem-top-sites``).
+
+Like telemetry, reporting is disabled by default: ``active`` is None and
+``stage`` returns a no-op context, so normal runs are not traced at all.
+Reports can be appended as JSON lines to a history file to track the numbers
+across versions and inputs.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage
+    resource = None
+
+# Allocation sites listed per stage
+TOP_SITES = 3
+MIB = 1024 * 1024
+
+# Active MemoryReport instance, or None when reporting is disabled
+active = None
+
+
+def enable(frames=1, top_sites=False):
+    """Start tracing allocations and return the active MemoryReport.
+
+    Args:
+        frames: Frames stored per traced allocation
+        top_sites: Snapshot each stage to list its top allocation sites
+    """
+    global active
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    active = MemoryReport(top_sites=top_sites)
+    return active
+
+
+def disable():
+    """Stop tracing allocations and discard the report."""
+    global active
+    active = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class StageUsage:
+    """Memory used by one stage; callers set ``rows`` once it is known."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        self.blocks = 0
+        self.max_rss_bytes = None
+        self.rss_growth_bytes = None
+        self.top_sites = []
+
+    def per_row(self, value):
+        return value / self.rows if self.rows and value is not None else None
+
+    def to_dict(self):
+        return {
+            'stage': self.name,
+            'rows': self.rows,
+            'seconds': round(self.seconds, 4),
+            'peak_bytes': self.peak_bytes,
+            'retained_bytes': self.retained_bytes,
+            'peak_bytes_per_row': self.per_row(self.peak_bytes),
+            'retained_bytes_per_row': self.per_row(self.retained_bytes),
+            'blocks': self.blocks,
+            'max_rss_bytes': self.max_rss_bytes,
+            'rss_growth_bytes': self.rss_growth_bytes,
+            'top_sites': self.top_sites,
+        }
+
+
+def stage(name):
+    """Return a context manager measuring a stage, yielding its StageUsage.
+
+    When reporting is disabled the yielded StageUsage is simply discarded.
+    """
+    if active is None:
+        return _untracked(name)
+    return active.stage(name)
+
+
+@contextmanager
+def _untracked(name):
+    yield StageUsage(name)
+
+
+def _take_snapshot():
+    """Snapshot traced allocations, leaving out tracemalloc's own."""
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def max_rss_bytes():
+    """Return the process maximum resident set size in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class MemoryReport:
+    """Collect StageUsage records for the stages of a run."""
+
+    def __init__(self, top_sites=False):
+        self.stages = []
+        self.top_sites = top_sites
+
+    @contextmanager
+    def stage(self, name):
+        usage = StageUsage(name)
+        start_snapshot = _take_snapshot() if self.top_sites else None
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start_current, _ = tracemalloc.get_traced_memory()
+        start_blocks = sys.getallocatedblocks()
+        start_rss = max_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield usage
+        finally:
+            usage.seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            usage.peak_bytes = max(0, peak - start_current)
+            usage.retained_bytes = current - start_current
+            usage.blocks = sys.getallocatedblocks() - start_blocks
+            usage.max_rss_bytes = max_rss_bytes()
+            if start_rss is not None:
+                usage.rss_growth_bytes = usage.max_rss_bytes - start_rss
+            if start_snapshot is not None:
+                differences = _take_snapshot().compare_to(start_snapshot, 'lineno')
+                usage.top_sites = [
+                    {'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                     'bytes': stat.size_diff, 'blocks': stat.count_diff}
+                    for stat in differences[:TOP_SITES] if stat.size_diff > 0
+                ]
+                del start_snapshot, differences
+            self.stages.append(usage)
+
+    def to_dict(self, **metadata):
+        record = dict(metadata)
+        record['stages'] = [usage.to_dict() for usage in self.stages]
+        return record
+
+    def format(self):
+        """Format the per-stage table and top allocation sites."""
+        lines = [
+            "MEMORY REPORT (tracemalloc; RSS from getrusage)",
+            f"{'stage':<8} {'rows':>9} {'peak MiB':>9} {'kept MiB':>9} {'peak B/row':>11} "
+            f"{'kept B/row':>11} {'blocks':>10} {'max RSS MiB':>12}",
+        ]
+        for usage in self.stages:
+            peak_per_row = usage.per_row(usage.peak_bytes)
+            kept_per_row = usage.per_row(usage.retained_bytes)
+            rss = '-' if usage.max_rss_bytes is None else f"{usage.max_rss_bytes / MIB:.1f}"
+            if usage.rss_growth_bytes:
+                rss += f" (+{usage.rss_growth_bytes / MIB:.1f})"
+            lines.append(
+                f"{usage.name:<8} {usage.rows:>9} {usage.peak_bytes / MIB:>9.2f} "
+                f"{usage.retained_bytes / MIB:>9.2f} "
+                f"{'-' if peak_per_row is None else f'{peak_per_row:.0f}':>11} "
+                f"{'-' if kept_per_row is None else f'{kept_per_row:.0f}':>11} "
+                f"{usage.blocks:>10} {rss:>12}"
+            )
+        for usage in self.stages:
+            if usage.top_sites:
+                lines.append(f"Top allocations in {usage.name}:")
+                for site in usage.top_sites:
+                    lines.append(f"  {site['bytes'] / MIB:8.2f} MiB  {site['blocks']:>9} blocks  "
+                                 f"{_short_path(site['site'])}")
+        return '\n'.join(lines)
+
+    def append_history(self, path, **metadata):
+        """Append this report as a JSON line to a history file.
+
+        Returns:
+            The previous record for the same input, or None
+        """
+        previous = None
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('input') == metadata.get('input'):
+                        previous = record
+        except OSError:
+            pass
+
+        record = self.to_dict(timestamp=datetime.now().isoformat(timespec='seconds'), **metadata)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return previous
+
+    def format_comparison(self, previous):
+        """Compare peak bytes per row with a previous history record."""
+        earlier = {entry['stage']: entry for entry in previous.get('stages', [])}
+        lines = [f"Compared with run of {previous.get('timestamp')} (QRate {previous.get('version')}):"]
+        for usage in self.stages:
+            before = earlier.get(usage.name, {}).get('peak_bytes_per_row')
+            now = usage.per_row(usage.peak_bytes)
+            if before and now is not None:
+                lines.append(f"  {usage.name:<8} peak B/row {before:.0f} -> {now:.0f} ({(now - before) / before:+.1%})")
+        return '\n'.join(lines)
+
+
+def _short_path(site):
+    """Shorten an allocation site to its path below the package or stdlib directory."""
+    for marker in (f"{os.sep}qrate{os.sep}", f"{os.sep}lib{os.sep}"):
+        index = site.rfind(marker)
+        if index != -1:
+            return site[index + 1:]
+    return site
@@ -1,309 +1,519 @@
 import yaml
 import os
 import pkg_resources
+from operator import eq, ne, lt, le, gt, ge
+from .species_index import SpeciesIndex
+
+# Built-in operators, grouped by how they read the row; OPERATORS below holds
+# them and any operators registered by plugins
+COMPARISON_OPERATORS = ("==", "!=", "<", "<=", ">", ">=")
+NUMERIC_OPERATORS = ("<", "<=", ">", ">=")
+STRING_OPERATORS = ("contains",)
+RANGE_OPERATORS = ("outside_pct",)
+SPECIES_OPERATORS = (
+    "species_scheme_compatible",
+    "genus_level_match",
+    "species_subspecies_match",
+    "species_different_genus_match",
+    "species_genus_mismatch",
+    "species_synonym_match",
+    "species_within_complex",
+)
+KNOWN_OPERATORS = COMPARISON_OPERATORS + STRING_OPERATORS + RANGE_OPERATORS + SPECIES_OPERATORS
+
+# Operators that expect a boolean `value` (True selects the positive case)
+BOOLEAN_OPERATORS = RANGE_OPERATORS + SPECIES_OPERATORS
+
+# Row columns read by each operator in addition to the condition field,
+# kept in step with the registry by add_operator
+OPERATOR_FIELDS = {}
+
+# Mapping files each operator loads from the config directory
+OPERATOR_MAPPINGS = {}
+
+# Parsed mapping files, loaded once per process and kept warm between rows and files
+_mapping_cache = {}
+_species_index = None
+
+def find_mapping_file(mapping_name):
+    """Return the path of a mapping file in the package config directory."""
+    try:
+        return pkg_resources.resource_filename('qrate', f'config/{mapping_name}')
+    except:
+        return os.path.join(os.path.dirname(__file__), 'config', mapping_name)
+
+def load_mapping(mapping_name):
+    """Load a mapping file from the config directory, caching the parsed result.
+
+    Raises the underlying error if the file cannot be read or parsed; failures
+    are not cached, so a fixed file is picked up on the next call.
+    """
+    mapping = _mapping_cache.get(mapping_name)
+    if mapping is None:
+        with open(find_mapping_file(mapping_name), 'r') as f:
+            mapping = yaml.safe_load(f)
+        _mapping_cache[mapping_name] = mapping
+    return mapping
+
+def clear_mapping_cache():
+    """Forget cached mapping files and indexes so they are re-read on next use."""
+    global _species_index
+    _mapping_cache.clear()
+    _species_index = None
+
+def get_species_index():
+    """Return the integer SpeciesIndex over the species mapping files, building it once.
+
+    A mapping that cannot be loaded is left out of the index, and the operators
+    that need it evaluate as they did when the file failed to load.
+    """
+    global _species_index
+    if _species_index is None:
+        mappings = {}
+        for operator in ("species_scheme_compatible", "species_synonym_match", "species_within_complex"):
+            try:
+                mappings[operator] = load_mapping(OPERATOR_MAPPINGS[operator])
+            except Exception:
+                mappings[operator] = None
+        _species_index = SpeciesIndex(
+            scheme_mapping=mappings["species_scheme_compatible"],
+            synonym_mapping=mappings["species_synonym_match"],
+            complex_mapping=mappings["species_within_complex"],
+        )
+    return _species_index
+
+class Operator:
+    """A condition operator and the implementations the engine can choose from.
+
+    Attributes:
+        name: Operator name used in rules
+        scalar: Function (field_value, value, row, condition) returning whether
+            the condition holds; field_value has already had the shared
+            boolean and numeric conversions applied
+        batch: Optional factory taking a condition and returning a function
+            that evaluates it over a list of rows, returning a list of results
+        precompile: Optional factory taking a condition and returning a
+            function that evaluates it for one row, or None to use the scalar
+        fields: Row columns read in addition to the condition field
+        mapping: Mapping file the operator loads from the config directory
+        boolean: Whether the operator expects a boolean value
+        numeric: Whether the field and value are converted to numbers first
+        cost: Relative cost per row for the optimizer, or None for the default
+    """
+
+    __slots__ = ('name', 'scalar', 'batch', 'precompile', 'fields', 'mapping', 'boolean', 'numeric', 'cost')
+
+    def __init__(self, name, scalar, batch=None, precompile=None, fields=(), mapping=None,
+                 boolean=False, numeric=False, cost=None):
+        self.name = name
+        self.scalar = scalar
+        self.batch = batch
+        self.precompile = precompile
+        self.fields = tuple(fields)
+        self.mapping = mapping
+        self.boolean = boolean
+        self.numeric = numeric
+        self.cost = cost
+
+    def __repr__(self):
+        return f"Operator({self.name!r})"
+
+
+# Registered operators by name: the built-ins below plus any plugins
+OPERATORS = {}
+# Entry point group scanned by load_operator_plugins
+OPERATOR_ENTRY_POINT_GROUP = 'qrate.operators'
+_plugins_loaded = False
+
+
+def add_operator(operator, replace=False):
+    """Register an Operator instance.
+
+    Raises:
+        ValueError: If an operator of that name exists and replace is False
+    """
+    if operator.name in OPERATORS and not replace:
+        raise ValueError(f"operator '{operator.name}' is already registered")
+    OPERATORS[operator.name] = operator
+    OPERATOR_FIELDS.pop(operator.name, None)
+    OPERATOR_MAPPINGS.pop(operator.name, None)
+    if operator.fields:
+        OPERATOR_FIELDS[operator.name] = operator.fields
+    if operator.mapping:
+        OPERATOR_MAPPINGS[operator.name] = operator.mapping
+    return operator
+
+
+def register_operator(name, scalar, batch=None, precompile=None, fields=(), mapping=None,
+                      boolean=False, numeric=False, cost=None, replace=False):
+    """Register an operator for use in rules; see Operator for the arguments.
 
-def evaluate_condition(row, condition):
-    """Evaluate a single condition against a row of QC data.
-    
-    Args:
-        row: Dictionary representing a QC result row
-        condition: Dictionary with field, operator, and value(s)
-        
     Returns:
-        Boolean indicating whether the condition is met
+        The registered Operator
     """
+    return add_operator(Operator(name, scalar, batch=batch, precompile=precompile, fields=fields,
+                                 mapping=mapping, boolean=boolean, numeric=numeric, cost=cost),
+                        replace=replace)
+
+
+def get_operator(name):
+    """Return the registered Operator for a name, or None."""
+    return OPERATORS.get(name)
+
+
+def load_operator_plugins():
+    """Register operators published under the 'qrate.operators' entry point group.
+
+    An entry point refers either to an Operator instance or to a function,
+    called without arguments, that calls register_operator. Plugins are
+    loaded once per process.
+
+    Returns:
+        List of messages for plugins that failed to load
+    """
+    global _plugins_loaded
+    if _plugins_loaded:
+        return []
+    _plugins_loaded = True
+    errors = []
+    for entry_point in pkg_resources.iter_entry_points(OPERATOR_ENTRY_POINT_GROUP):
+        try:
+            plugin = entry_point.load()
+            if isinstance(plugin, Operator):
+                add_operator(plugin)
+            else:
+                plugin()
+        except Exception as e:
+            errors.append(f"operator plugin '{entry_point.name}' failed to load: {e}")
+    return errors
+
+
+def _apply(operator, row, condition):
+    """Evaluate a condition with a resolved Operator, applying the shared conversions."""
     field = condition.get('field')
-    operator = condition.get('operator')
     value = condition.get('value')
-    
+
     # Handle missing fields gracefully
     if field not in row:
         return False
-    
+
     # Get field value, handling type conversion
     field_value = row[field]
-    
+
     # Convert string representations of booleans
     if isinstance(value, bool):
         if field_value.lower() == 'true':
             field_value = True
         elif field_value.lower() == 'false':
             field_value = False
-    
+
     # Convert to numbers for numeric comparisons
-    if operator in ['<', '<=', '>', '>=']:
+    if operator.numeric:
         try:
             field_value = float(field_value) if field_value else 0
             value = float(value)
         except ValueError:
             return False
+
+    return operator.scalar(field_value, value, row, condition)
+
+
+def evaluate_condition(row, condition):
+    """Evaluate a single condition against a row of QC data.
     
-    # Evaluate based on operator
-    if operator == "==":
-        return field_value == value
-    elif operator == "!=":
-        return field_value != value
-    elif operator == "<":
-        return field_value < value
-    elif operator == "<=":
-        return field_value <= value
-    elif operator == ">":
-        return field_value > value
-    elif operator == ">=":
-        return field_value >= value
-    elif operator == "contains":
-        # Case-insensitive string matching
-        return str(value).lower() in str(field_value).lower()
-        
-    elif operator == "outside_pct":
-        # Special operator for checking if values are OUTSIDE percentage-based range 
-        min_field = condition.get('min_field')
-        max_field = condition.get('max_field')
-        pct = float(condition.get('pct', 0.1))  # Default to 10%
+    Args:
+        row: Dictionary representing a QC result row
+        condition: Dictionary with field, operator, and value(s)
         
-        # Handle missing bounds fields
-        if min_field not in row or max_field not in row:
+    Returns:
+        Boolean indicating whether the condition is met
+    """
+    operator = OPERATORS.get(condition.get('operator'))
+    if operator is None:
+        # Unrecognized operator
+        return False
+    return _apply(operator, row, condition)
+
+
+def compile_condition(condition):
+    """Return a function evaluating a condition for one row, like evaluate_condition.
+
+    The operator is resolved once, and its precompile hook is used when it
+    has one that accepts this condition.
+    """
+    operator = OPERATORS.get(condition.get('operator'))
+    if operator is None:
+        return lambda row: False
+    if operator.precompile is not None:
+        check = operator.precompile(condition)
+        if check is not None:
+            return check
+    return lambda row: _apply(operator, row, condition)
+
+
+def compile_batch(condition):
+    """Return a function evaluating a condition over a list of rows.
+
+    Uses the operator's batch hook when it has one that accepts this
+    condition, and otherwise the compiled single-row check in a loop.
+    """
+    operator = OPERATORS.get(condition.get('operator'))
+    if operator is not None and operator.batch is not None:
+        evaluate = operator.batch(condition)
+        if evaluate is not None:
+            return evaluate
+    check = compile_condition(condition)
+    return lambda rows: [check(row) for row in rows]
+
+
+def _select(matched, value):
+    """Return the positive case for value True and the negative for False."""
+    if value is True:
+        return matched
+    elif value is False:
+        return not matched
+    return False
+
+
+def _genera(row):
+    species_obs = row.get('SPECIES_OBS', '').strip()
+    species_exp = row.get('SPECIES_EXP', '').strip()
+    genus_obs = species_obs.split()[0] if species_obs else ''
+    genus_exp = species_exp.split()[0] if species_exp else ''
+    return species_obs, species_exp, genus_obs, genus_exp
+
+
+def _contains(field_value, value, row, condition):
+    # Case-insensitive string matching
+    return str(value).lower() in str(field_value).lower()
+
+
+def _outside_pct(field_value, value, row, condition):
+    # Checks if values are OUTSIDE a percentage-based range around min_field..max_field
+    min_field = condition.get('min_field')
+    max_field = condition.get('max_field')
+    pct = float(condition.get('pct', 0.1))  # Default to 10%
+
+    # Handle missing bounds fields
+    if min_field not in row or max_field not in row:
+        return False
+
+    try:
+        min_value = float(row[min_field]) if row[min_field] and row[min_field] != '-' else None
+        max_value = float(row[max_field]) if row[max_field] and row[max_field] != '-' else None
+        field_value = float(field_value) if field_value else 0
+
+        # Can't calculate range if either bound is missing
+        if min_value is None or max_value is None:
             return False
-            
-        try:
-            # Extract values and convert to float
-            min_value = float(row[min_field]) if row[min_field] and row[min_field] != '-' else None
-            max_value = float(row[max_field]) if row[max_field] and row[max_field] != '-' else None
-            field_value = float(field_value) if field_value else 0
-            
-            # Can't calculate range if either bound is missing
-            if min_value is None or max_value is None:
-                return False
-                
-            # Calculate extended range with percentage
-            extended_min = min_value * (1 - pct)
-            extended_max = max_value * (1 + pct)
-            
-            # Check if value is OUTSIDE extended range
-            is_outside = field_value < extended_min or field_value > extended_max
-            
-            # Return result based on expected value
-            # If value is True, return True when field is outside range
-            # If value is False, return True when field is NOT outside range (i.e., inside range)
-            if value is True:
-                return is_outside
-            elif value is False:
-                return not is_outside
-            
-        except (ValueError, TypeError):
+
+        extended_min = min_value * (1 - pct)
+        extended_max = max_value * (1 + pct)
+        # True selects values outside the extended range, False values inside it
+        return _select(field_value < extended_min or field_value > extended_max, value)
+    except (ValueError, TypeError):
+        return False
+
+
+def _species_scheme_compatible(field_value, value, row, condition):
+    # SPECIES_OBS is compatible with SCHEME in the species scheme mapping
+    index = get_species_index()
+    if index.scheme_pairs is None:
+        return False
+    # None when SCHEME is not in the mapping
+    is_compatible = index.scheme_compatible(index.row_ids(row))
+    if is_compatible is None:
+        return False
+    return _select(is_compatible, value)
+
+
+def _genus_level_match(field_value, value, row, condition):
+    # SPECIES_OBS matches SPECIES_EXP at genus level (first word, case-insensitive)
+    _, _, genus_obs, genus_exp = _genera(row)
+    genus_matches = genus_exp.lower() == genus_obs.lower() if genus_exp and genus_obs else False
+    return _select(genus_matches, value)
+
+
+def _species_subspecies_match(field_value, value, row, condition):
+    # SPECIES_EXP contains "ssp" and SPECIES_OBS matches the base species part
+    # e.g., "Salmonella enterica ssp enterica" vs "Salmonella enterica"
+    species_obs = row.get('SPECIES_OBS', '').strip()
+    species_exp = row.get('SPECIES_EXP', '').strip()
+    if " ssp " not in species_exp.lower():
+        subspecies_match = False
+    else:
+        base_species = species_exp.split(" ssp ")[0].strip()
+        subspecies_match = species_obs.lower() == base_species.lower()
+    return _select(subspecies_match, value)
+
+
+def _species_different_genus_match(field_value, value, row, condition):
+    # Both species are specific (no "species" or "ssp"), share a genus, but differ
+    species_obs, species_exp, genus_obs, genus_exp = _genera(row)
+    if (" species" in species_obs.lower() or " species" in species_exp.lower() or
+        " ssp " in species_obs.lower() or " ssp " in species_exp.lower()):
+        different_genus_match = False
+    else:
+        different_genus_match = (genus_obs and genus_exp and
+                genus_obs.lower() == genus_exp.lower() and
+                species_obs.lower() != species_exp.lower())
+    return _select(different_genus_match, value)
+
+
+def _species_genus_mismatch(field_value, value, row, condition):
+    # SPECIES_EXP and SPECIES_OBS have different genera (complete mismatch)
+    _, _, genus_obs, genus_exp = _genera(row)
+    genus_mismatch = (genus_obs and genus_exp and
+            genus_obs.lower() != genus_exp.lower())
+    return _select(genus_mismatch, value)
+
+
+def _species_synonym_match(field_value, value, row, condition):
+    # SPECIES_OBS is a synonym of SPECIES_EXP, in either direction
+    index = get_species_index()
+    if index.synonym_pairs is None:
+        synonym_match = False
+    else:
+        synonym_match = index.synonym_match(index.row_ids(row))
+    return _select(synonym_match, value)
+
+
+def _species_within_complex(field_value, value, row, condition):
+    # SPECIES_OBS is within the species complex of SPECIES_EXP
+    index = get_species_index()
+    if index.complex_pairs is None:
+        return False
+    # None when SPECIES_EXP is not a complex in the mapping
+    is_within_complex = index.within_complex(index.row_ids(row))
+    if is_within_complex is None:
+        return False
+    return _select(is_within_complex, value)
+
+
+def _precompile_equality(condition):
+    """Single-row check for == and != with the boolean conversion folded in."""
+    field = condition.get('field')
+    value = condition.get('value')
+    equal = condition.get('operator') == '=='
+    if isinstance(value, bool):
+        # Only 'true'/'false' (any case) convert to booleans, so the field
+        # equals the value exactly when it reads as that boolean
+        text = 'true' if value else 'false'
+        if equal:
+            return lambda row: field in row and row[field].lower() == text
+        return lambda row: field in row and row[field].lower() != text
+    if equal:
+        return lambda row: field in row and row[field] == value
+    return lambda row: field in row and row[field] != value
+
+
+def _batch_equality(condition):
+    field = condition.get('field')
+    value = condition.get('value')
+    if isinstance(value, bool):
+        check = _precompile_equality(condition)
+        return lambda rows: [check(row) for row in rows]
+    if condition.get('operator') == '==':
+        return lambda rows: [field in row and row[field] == value for row in rows]
+    return lambda rows: [field in row and row[field] != value for row in rows]
+
+
+def _numeric_threshold(condition):
+    """Return the condition value as a float, or None when the generic path must handle it."""
+    value = condition.get('value')
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        # evaluate_condition returns False for every row
+        return False
+    except TypeError:
+        return None
+
+
+def _precompile_numeric(condition):
+    threshold = _numeric_threshold(condition)
+    if threshold is None:
+        return None
+    if threshold is False:
+        return lambda row: False
+    field = condition.get('field')
+    compare = NUMERIC_COMPARISONS[condition.get('operator')]
+
+    def check(row):
+        if field not in row:
             return False
-        
-    elif operator == "species_scheme_compatible":
-        # Special operator to check if SPECIES_OBS is compatible with SCHEME
-        # This requires loading the species scheme mapping
-        
+        field_value = row[field]
         try:
-            # Try to find config file relative to package
-            try:
-                config_path = pkg_resources.resource_filename('qrate', 'config/species_scheme_mapping.yaml')
-            except:
-                config_path = os.path.join(os.path.dirname(__file__), 'config', 'species_scheme_mapping.yaml')
-                
-            with open(config_path, 'r') as f:
-                mapping = yaml.safe_load(f)
-        except:
-            return False
-        
-        species_obs = row.get('SPECIES_OBS', '')
-        scheme = row.get('SCHEME', '')
-        
-        # print(f"DEBUG SCHEME_COMPATIBLE: SPECIES_OBS='{species_obs}', SCHEME='{scheme}'")
-        # print(f"DEBUG: Available schemes: {list(mapping.keys()) if mapping else 'None'}")
-    
-        if not mapping or scheme not in mapping:
-            # print(f"DEBUG: Scheme '{scheme}' not found in mapping, returning False")
+            return compare(float(field_value) if field_value else 0, threshold)
+        except ValueError:
             return False
-        
-        compatible_species = mapping[scheme]
-        is_compatible = species_obs in compatible_species
-        # print(f"DEBUG: Compatible species for '{scheme}': {compatible_species}")
-        # print(f"DEBUG: Is '{species_obs}' in compatible list? {is_compatible}")
-        
-        # Return result based on expected value
-        # If value is True, return True when species IS compatible
-        # If value is False, return True when species is NOT compatible
-        if value is True:
-            return is_compatible
-        elif value is False:
-            return not is_compatible
-    
-    elif operator == "genus_level_match":
-        # Special operator to check if SPECIES_OBS matches at genus level with SPECIES_EXP
-        # when SPECIES_EXP is in "<genus> species" format
-        species_obs = row.get('SPECIES_OBS', '').strip()
-        species_exp = row.get('SPECIES_EXP', '').strip()
-        
-        # Extract genus from SPECIES_EXP (first word)
-        genus_exp = species_exp.split()[0] if species_exp else ''
-        
-        # Extract genus from SPECIES_OBS (first word)
-        genus_obs = species_obs.split()[0] if species_obs else ''
-        
-        # Check if genus matches (case-insensitive)
-        genus_matches = genus_exp.lower() == genus_obs.lower() if genus_exp and genus_obs else False
-        
-        # Return result based on expected value
-        # If value is True, return True when genus DOES match
-        # If value is False, return True when genus does NOT match
-        if value is True:
-            return genus_matches
-        elif value is False:
-            return not genus_matches
-    
-    elif operator == "species_subspecies_match":
-        # SPECIES_EXP contains "ssp" and SPECIES_OBS matches the base species part
-        # e.g., "Salmonella enterica ssp enterica" vs "Salmonella enterica"
-        species_obs = row.get('SPECIES_OBS', '').strip()
-        species_exp = row.get('SPECIES_EXP', '').strip()
-        
-        # Check if SPECIES_EXP contains "ssp"
-        if " ssp " not in species_exp.lower():
-            subspecies_match = False
-        else:
-            # Extract the base species part (everything before " ssp ")
-            base_species = species_exp.split(" ssp ")[0].strip()
-            
-            # Check if SPECIES_OBS matches the base species (case-insensitive)
-            subspecies_match = species_obs.lower() == base_species.lower()
-        
-        # Return result based on expected value
-        # If value is True, return True when subspecies DOES match
-        # If value is False, return True when subspecies does NOT match
-        if value is True:
-            return subspecies_match
-        elif value is False:
-            return not subspecies_match
-    
-    elif operator == "species_different_genus_match":
-        # Both species are specific (not generic), have same genus, but are different species
-        # Excludes cases where either contains "species" or "ssp"
-        species_obs = row.get('SPECIES_OBS', '').strip()
-        species_exp = row.get('SPECIES_EXP', '').strip()
-        
-        # Both should not contain "species" or "ssp"
-        if (" species" in species_obs.lower() or " species" in species_exp.lower() or
-            " ssp " in species_obs.lower() or " ssp " in species_exp.lower()):
-            different_genus_match = False
-        else:
-            # Extract genus from both
-            genus_obs = species_obs.split()[0] if species_obs else ''
-            genus_exp = species_exp.split()[0] if species_exp else ''
-            
-            # Check if genus matches but species are different
-            different_genus_match = (genus_obs and genus_exp and 
-                    genus_obs.lower() == genus_exp.lower() and 
-                    species_obs.lower() != species_exp.lower())
-        
-        # Return result based on expected value
-        # If value is True, return True when there IS a different genus match
-        # If value is False, return True when there is NOT a different genus match
-        if value is True:
-            return different_genus_match
-        elif value is False:
-            return not different_genus_match
-    
-    elif operator == "species_genus_mismatch":
-        # SPECIES_EXP and SPECIES_OBS have different genera (complete mismatch)
-        species_obs = row.get('SPECIES_OBS', '').strip()
-        species_exp = row.get('SPECIES_EXP', '').strip()
-        
-        # Extract genus from both
-        genus_obs = species_obs.split()[0] if species_obs else ''
-        genus_exp = species_exp.split()[0] if species_exp else ''
-        
-        # Check if genera are different (case-insensitive)
-        genus_mismatch = (genus_obs and genus_exp and 
-                genus_obs.lower() != genus_exp.lower())
-        
-        # Return result based on expected value
-        # If value is True, return True when genera DO mismatch
-        # If value is False, return True when genera do NOT mismatch
-        if value is True:
-            return genus_mismatch
-        elif value is False:
-            return not genus_mismatch
-    
-    elif operator == "species_synonym_match":
-        # Special operator to check if SPECIES_OBS is a synonym of SPECIES_EXP
-        # This requires loading the species synonym mapping
-        
-        try:
-            # Try to find config file relative to package
-            try:
-                config_path = pkg_resources.resource_filename('qrate', 'config/species_synonym_mapping.yaml')
-            except:
-                config_path = os.path.join(os.path.dirname(__file__), 'config', 'species_synonym_mapping.yaml')
-                
-            with open(config_path, 'r') as f:
-                mapping = yaml.safe_load(f)
-        except:
-            synonym_match = False
-        else:
-            species_obs = row.get('SPECIES_OBS', '').strip()
-            species_exp = row.get('SPECIES_EXP', '').strip()
-            
-            if not mapping or 'synonyms' not in mapping:
-                synonym_match = False
-            else:
-                synonyms = mapping['synonyms']
-                
-                # Check if SPECIES_OBS is a synonym for SPECIES_EXP
-                synonym_match = (synonyms.get(species_obs) == species_exp or 
-                               synonyms.get(species_exp) == species_obs)
-        
-        # Return result based on expected value
-        # If value is True, return True when species IS a synonym
-        # If value is False, return True when species is NOT a synonym
-        if value is True:
-            return synonym_match
-        elif value is False:
-            return not synonym_match
-    
-    # for species_within_complex
-    elif operator == "species_within_complex":
-        # Special operator to check if SPECIES_OBS is within the species complex of SPECIES_EXP
-        # load the species complex mapping
+    return check
 
-        try:
-            # Try to find config file relative to package
+
+def _batch_numeric(condition):
+    threshold = _numeric_threshold(condition)
+    if threshold is None:
+        return None
+    if threshold is False:
+        return lambda rows: [False] * len(rows)
+    field = condition.get('field')
+    compare = NUMERIC_COMPARISONS[condition.get('operator')]
+
+    def evaluate(rows):
+        results = []
+        append = results.append
+        for row in rows:
+            if field not in row:
+                append(False)
+                continue
+            field_value = row[field]
             try:
-                config_path = pkg_resources.resource_filename('qrate', 'config/species_complex_mapping.yaml')
-            except:
-                config_path = os.path.join(os.path.dirname(__file__), 'config', 'species_complex_mapping.yaml')
-                
-            with open(config_path, 'r') as f:
-                complex_mapping = yaml.safe_load(f)
-        except:
-            return False
+                append(compare(float(field_value) if field_value else 0, threshold))
+            except ValueError:
+                append(False)
+        return results
+    return evaluate
 
-        species_obs = row.get('SPECIES_OBS', '')
-        species_exp = row.get('SPECIES_EXP', '')
 
-        # print(f"DEBUG: Checking if '{species_obs}' is within the complex of '{species_exp}'")
-        # print(f"DEBUG: Available species complexes: {list(complex_mapping.keys()) if complex_mapping else 'None'}")
-        if not complex_mapping or species_exp not in complex_mapping:
-            # print(f"DEBUG: Species '{species_exp}' not found in complex mapping, returning False")
-            return False
-        
-        complex_species = complex_mapping[species_exp]
-        is_within_complex = species_obs in complex_species
-        # print(f"DEBUG: Species complex for '{species_exp}': {complex_species}")
-        # print(f"DEBUG: Is '{species_obs}' within complex? {is_within_complex}")
-        
-        # Return result based on expected value
-        # If value is True, return True when species IS within complex
-        # If value is False, return True when species is NOT within complex
-        if value is True:
-            return is_within_complex
-        elif value is False:
-            return not is_within_complex
-                        
-    # Unrecognized operator
-    return False
+def _precompile_contains(condition):
+    value = condition.get('value')
+    if isinstance(value, bool):
+        return None
+    field = condition.get('field')
+    needle = str(value).lower()
+    return lambda row: field in row and needle in str(row[field]).lower()
 
-    
+
+# Built-in comparisons, evaluated on the converted field value
+COMPARISONS = {'==': eq, '!=': ne, '<': lt, '<=': le, '>': gt, '>=': ge}
+NUMERIC_COMPARISONS = {name: COMPARISONS[name] for name in NUMERIC_OPERATORS}
+
+
+def _comparison(compare):
+    return lambda field_value, value, row, condition: compare(field_value, value)
+
+
+for _name in ('==', '!='):
+    register_operator(_name, _comparison(COMPARISONS[_name]),
+                      batch=_batch_equality, precompile=_precompile_equality)
+for _name in NUMERIC_OPERATORS:
+    register_operator(_name, _comparison(COMPARISONS[_name]),
+                      batch=_batch_numeric, precompile=_precompile_numeric, numeric=True)
+register_operator('contains', _contains, precompile=_precompile_contains)
+register_operator('outside_pct', _outside_pct, boolean=True)
+register_operator('species_scheme_compatible', _species_scheme_compatible, boolean=True,
+                  fields=("SPECIES_OBS", "SCHEME"), mapping="species_scheme_mapping.yaml")
+register_operator('genus_level_match', _genus_level_match, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"))
+register_operator('species_subspecies_match', _species_subspecies_match, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"))
+register_operator('species_different_genus_match', _species_different_genus_match, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"))
+register_operator('species_genus_mismatch', _species_genus_mismatch, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"))
+register_operator('species_synonym_match', _species_synonym_match, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"), mapping="species_synonym_mapping.yaml")
+register_operator('species_within_complex', _species_within_complex, boolean=True,
+                  fields=("SPECIES_OBS", "SPECIES_EXP"), mapping="species_complex_mapping.yaml")
@@ -0,0 +1,111 @@
+"""Curating one QC sheet with several rulesets ("profiles") in a single pass.
+
+Each profile is a name and a rules file, e.g. ``reference=rules_ref.yaml``.
+The input is read once and curated in chunks: every profile's engine curates
+the chunk in turn, and the engines share a SharedConditions, so a condition
+that appears in several rulesets is evaluated once per row. Results are
+identical to curating the sheet with each ruleset separately.
+
+Results are written either to one output per profile, or to a single output
+that keeps the input columns and adds ``NAME.MMS103``, ``NAME.MMS109``,
+``NAME.TEST_QC`` and ``NAME.COMMENT`` for every profile.
+"""
+
+import os
+from itertools import islice
+from .curation_engine import CurationEngine, SharedConditions, BATCH_SIZE, CURATED_FIELDS
+from .rule_trace import TRACE_COLUMN
+
+# Separator between a profile name and the curated column in --profile-columns output
+COLUMN_SEPARATOR = '.'
+
+
+class ProfileError(ValueError):
+    """Raised when profile arguments are invalid."""
+
+
+def parse_profile_spec(spec):
+    """Parse a NAME=RULES argument into (name, rules file).
+
+    Raises:
+        ProfileError: If the argument is not NAME=RULES
+    """
+    name, separator, rules_file = spec.partition('=')
+    name = name.strip()
+    if not separator or not name or not rules_file:
+        raise ProfileError(f"Profile '{spec}' must be NAME=RULES, e.g. outbreak=rules_outbreak.yaml")
+    if COLUMN_SEPARATOR in name or os.sep in name:
+        raise ProfileError(f"Profile name '{name}' must not contain '{COLUMN_SEPARATOR}' or '{os.sep}'")
+    return name, rules_file
+
+
+def parse_profile_specs(specs):
+    """Parse profile arguments, checking that names are unique."""
+    profiles = [parse_profile_spec(spec) for spec in specs]
+    names = [name for name, _ in profiles]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ProfileError(f"Profile name '{duplicates[0]}' is used more than once")
+    return profiles
+
+
+def profile_output_path(output_file, name):
+    """Output file for one profile, e.g. qc.curated.csv -> qc.curated.outbreak.csv."""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.{name}{ext}"
+
+
+class MultiProfileEngine:
+    """Curate rows with several rulesets, sharing condition results between them.
+
+    Args:
+        profiles: List of (name, prepared rules)
+        trace_column: Add a RULE_TRACE column to each profile's rows
+    """
+
+    def __init__(self, profiles, trace_column=False):
+        self.shared = SharedConditions()
+        self.trace_column = trace_column
+        self.engines = {
+            name: CurationEngine(rules, trace_column=trace_column, shared_conditions=self.shared)
+            for name, rules in profiles
+        }
+
+    def curate_data(self, qc_data):
+        """Curate rows with every profile.
+
+        Returns:
+            Dictionary mapping profile name to its list of curated rows
+        """
+        results = {name: [] for name in self.engines}
+        rows = iter(qc_data)
+        try:
+            while True:
+                chunk = list(islice(rows, BATCH_SIZE))
+                if not chunk:
+                    break
+                self.shared.clear()
+                for name, engine in self.engines.items():
+                    results[name].extend(engine.curate_data(chunk))
+        finally:
+            self.shared.clear()
+        return results
+
+    def curated_columns(self):
+        """Columns each profile contributes to a combined output."""
+        return CURATED_FIELDS + (TRACE_COLUMN,) if self.trace_column else CURATED_FIELDS
+
+    def combine(self, qc_data, results):
+        """Return the input rows with NAME.<column> curated columns for every profile."""
+        columns = self.curated_columns()
+        prefixed = {name: [(name + COLUMN_SEPARATOR + column, column) for column in columns]
+                    for name in results}
+        combined = []
+        for position, row in enumerate(qc_data):
+            row = dict(row)
+            for name, curated_rows in results.items():
+                curated = curated_rows[position]
+                for target, column in prefixed[name]:
+                    row[target] = curated[column]
+            combined.append(row)
+        return combined
@@ -0,0 +1,452 @@
+"""Frozen copy of the original curation engine, used as the equivalence baseline.
+
+This is the engine as it was before conditions were dispatched through the
+operator registry, species lookups went through SpeciesIndex and comment
+aggregation used pre-split comment templates: the if/elif
+``evaluate_condition`` and the sort-based ``aggregate_rule_results`` with
+``clean_comment_duplicates``, run over the raw rule dicts from the YAML file.
+qrate.equivalence compares every optimized engine against it, so do not
+optimize or refactor this module; a change to curation semantics has to be
+made here deliberately.
+
+The only departure from the original is that each mapping file is parsed
+once per process instead of once per condition, which does not change any
+result.
+"""
+
+import os
+import yaml
+import pkg_resources
+from . import operators
+from .ruleset import COMMENT_PARTS_KEY, RULE_BIT_KEY, SKIP_MASK_KEY
+
+# Operators the original engine knew; anything else is a plugin operator,
+# which the original did not support, and is evaluated by the registry
+ORIGINAL_OPERATORS = (
+    "==", "!=", "<", "<=", ">", ">=", "contains", "outside_pct",
+    "species_scheme_compatible", "genus_level_match", "species_subspecies_match",
+    "species_different_genus_match", "species_genus_mismatch", "species_synonym_match",
+    "species_within_complex",
+)
+# Prefixes clean_comment_duplicates removed from every comment after the first
+ORIGINAL_COMMENT_PREFIXES = (
+    "MMS103 FLAG",
+    "MMS103 Manual PASS",
+    "MMS109 FLAG",
+    "MMS109 Manual PASS",
+)
+# Keys prepare_rules adds to each rule, removed to recover the raw rule dicts
+PREPARED_KEYS = (COMMENT_PARTS_KEY, RULE_BIT_KEY, SKIP_MASK_KEY)
+
+_mappings = {}
+
+
+def raw_rules(rules):
+    """Return the rules as loaded from YAML, without the keys prepare_rules adds."""
+    return [
+        {key: value for key, value in rule.items() if key not in PREPARED_KEYS} if isinstance(rule, dict) else rule
+        for rule in rules
+    ]
+
+
+def _load_mapping(mapping_name):
+    """Parse a mapping file from the package config directory, once per process.
+
+    Raises the underlying error, uncached, if the file cannot be read or parsed.
+    """
+    if mapping_name not in _mappings:
+        try:
+            config_path = pkg_resources.resource_filename('qrate', f'config/{mapping_name}')
+        except:
+            config_path = os.path.join(os.path.dirname(__file__), 'config', mapping_name)
+        with open(config_path, 'r') as f:
+            _mappings[mapping_name] = yaml.safe_load(f)
+    return _mappings[mapping_name]
+
+
+def evaluate_condition(row, condition):
+    """Evaluate a single condition against a row of QC data.
+
+    Args:
+        row: Dictionary representing a QC result row
+        condition: Dictionary with field, operator, and value(s)
+
+    Returns:
+        Boolean indicating whether the condition is met
+    """
+    field = condition.get('field')
+    operator = condition.get('operator')
+    value = condition.get('value')
+
+    if operator not in ORIGINAL_OPERATORS and operators.get_operator(operator) is not None:
+        return operators.evaluate_condition(row, condition)
+
+    # Handle missing fields gracefully
+    if field not in row:
+        return False
+
+    # Get field value, handling type conversion
+    field_value = row[field]
+
+    # Convert string representations of booleans
+    if isinstance(value, bool):
+        if field_value.lower() == 'true':
+            field_value = True
+        elif field_value.lower() == 'false':
+            field_value = False
+
+    # Convert to numbers for numeric comparisons
+    if operator in ['<', '<=', '>', '>=']:
+        try:
+            field_value = float(field_value) if field_value else 0
+            value = float(value)
+        except ValueError:
+            return False
+
+    # Evaluate based on operator
+    if operator == "==":
+        return field_value == value
+    elif operator == "!=":
+        return field_value != value
+    elif operator == "<":
+        return field_value < value
+    elif operator == "<=":
+        return field_value <= value
+    elif operator == ">":
+        return field_value > value
+    elif operator == ">=":
+        return field_value >= value
+    elif operator == "contains":
+        # Case-insensitive string matching
+        return str(value).lower() in str(field_value).lower()
+
+    elif operator == "outside_pct":
+        # Values OUTSIDE a percentage-based range around min_field..max_field
+        min_field = condition.get('min_field')
+        max_field = condition.get('max_field')
+        pct = float(condition.get('pct', 0.1))  # Default to 10%
+
+        # Handle missing bounds fields
+        if min_field not in row or max_field not in row:
+            return False
+
+        try:
+            min_value = float(row[min_field]) if row[min_field] and row[min_field] != '-' else None
+            max_value = float(row[max_field]) if row[max_field] and row[max_field] != '-' else None
+            field_value = float(field_value) if field_value else 0
+
+            # Can't calculate range if either bound is missing
+            if min_value is None or max_value is None:
+                return False
+
+            extended_min = min_value * (1 - pct)
+            extended_max = max_value * (1 + pct)
+            is_outside = field_value < extended_min or field_value > extended_max
+
+            if value is True:
+                return is_outside
+            elif value is False:
+                return not is_outside
+
+        except (ValueError, TypeError):
+            return False
+
+    elif operator == "species_scheme_compatible":
+        # SPECIES_OBS is compatible with SCHEME in the species scheme mapping
+        try:
+            mapping = _load_mapping('species_scheme_mapping.yaml')
+        except:
+            return False
+
+        species_obs = row.get('SPECIES_OBS', '')
+        scheme = row.get('SCHEME', '')
+
+        if not mapping or scheme not in mapping:
+            return False
+
+        compatible_species = mapping[scheme]
+        is_compatible = species_obs in compatible_species
+
+        if value is True:
+            return is_compatible
+        elif value is False:
+            return not is_compatible
+
+    elif operator == "genus_level_match":
+        # SPECIES_OBS matches SPECIES_EXP at genus level
+        species_obs = row.get('SPECIES_OBS', '').strip()
+        species_exp = row.get('SPECIES_EXP', '').strip()
+
+        genus_exp = species_exp.split()[0] if species_exp else ''
+        genus_obs = species_obs.split()[0] if species_obs else ''
+
+        # Check if genus matches (case-insensitive)
+        genus_matches = genus_exp.lower() == genus_obs.lower() if genus_exp and genus_obs else False
+
+        if value is True:
+            return genus_matches
+        elif value is False:
+            return not genus_matches
+
+    elif operator == "species_subspecies_match":
+        # SPECIES_EXP contains "ssp" and SPECIES_OBS matches the base species part
+        species_obs = row.get('SPECIES_OBS', '').strip()
+        species_exp = row.get('SPECIES_EXP', '').strip()
+
+        if " ssp " not in species_exp.lower():
+            subspecies_match = False
+        else:
+            base_species = species_exp.split(" ssp ")[0].strip()
+            subspecies_match = species_obs.lower() == base_species.lower()
+
+        if value is True:
+            return subspecies_match
+        elif value is False:
+            return not subspecies_match
+
+    elif operator == "species_different_genus_match":
+        # Both species are specific, have the same genus, but are different species
+        species_obs = row.get('SPECIES_OBS', '').strip()
+        species_exp = row.get('SPECIES_EXP', '').strip()
+
+        if (" species" in species_obs.lower() or " species" in species_exp.lower() or
+            " ssp " in species_obs.lower() or " ssp " in species_exp.lower()):
+            different_genus_match = False
+        else:
+            genus_obs = species_obs.split()[0] if species_obs else ''
+            genus_exp = species_exp.split()[0] if species_exp else ''
+
+            different_genus_match = (genus_obs and genus_exp and
+                    genus_obs.lower() == genus_exp.lower() and
+                    species_obs.lower() != species_exp.lower())
+
+        if value is True:
+            return different_genus_match
+        elif value is False:
+            return not different_genus_match
+
+    elif operator == "species_genus_mismatch":
+        # SPECIES_EXP and SPECIES_OBS have different genera
+        species_obs = row.get('SPECIES_OBS', '').strip()
+        species_exp = row.get('SPECIES_EXP', '').strip()
+
+        genus_obs = species_obs.split()[0] if species_obs else ''
+        genus_exp = species_exp.split()[0] if species_exp else ''
+
+        genus_mismatch = (genus_obs and genus_exp and
+                genus_obs.lower() != genus_exp.lower())
+
+        if value is True:
+            return genus_mismatch
+        elif value is False:
+            return not genus_mismatch
+
+    elif operator == "species_synonym_match":
+        # SPECIES_OBS is a synonym of SPECIES_EXP in the species synonym mapping
+        try:
+            mapping = _load_mapping('species_synonym_mapping.yaml')
+        except:
+            synonym_match = False
+        else:
+            species_obs = row.get('SPECIES_OBS', '').strip()
+            species_exp = row.get('SPECIES_EXP', '').strip()
+
+            if not mapping or 'synonyms' not in mapping:
+                synonym_match = False
+            else:
+                synonyms = mapping['synonyms']
+                synonym_match = (synonyms.get(species_obs) == species_exp or
+                               synonyms.get(species_exp) == species_obs)
+
+        if value is True:
+            return synonym_match
+        elif value is False:
+            return not synonym_match
+
+    elif operator == "species_within_complex":
+        # SPECIES_OBS is within the species complex of SPECIES_EXP
+        try:
+            complex_mapping = _load_mapping('species_complex_mapping.yaml')
+        except:
+            return False
+
+        species_obs = row.get('SPECIES_OBS', '')
+        species_exp = row.get('SPECIES_EXP', '')
+
+        if not complex_mapping or species_exp not in complex_mapping:
+            return False
+
+        complex_species = complex_mapping[species_exp]
+        is_within_complex = species_obs in complex_species
+
+        if value is True:
+            return is_within_complex
+        elif value is False:
+            return not is_within_complex
+
+    # Unrecognized operator
+    return False
+
+
+def has_field_action(rule, field):
+    """Check if a rule has an action for the specified field."""
+    for action in rule.get('actions', []):
+        if action.get('field') == field:
+            return True
+    return False
+
+
+def check_rule_conditions(row, rule):
+    for condition in rule.get('conditions', []):
+        if not evaluate_condition(row, condition):
+            return False
+    return True
+
+
+def get_rule_action(rule, field):
+    for action in rule.get('actions', []):
+        if action.get('field') == field:
+            return action.get('value')
+    return None
+
+
+def get_rule_comment(rule):
+    """Extract COMMENT value from rule actions."""
+    for action in rule.get('actions', []):
+        if action.get('field') == 'COMMENT':
+            return action.get('value', '')
+    return ''
+
+
+def evaluate_mms_rule(row, rules, field):
+    """Evaluate all matching rules for a field and aggregate results."""
+    relevant_rules = [rule for rule in rules if has_field_action(rule, field)]
+    matched_rules = []
+    skipped_rules = set()
+
+    # First pass: identify which rules are met and which should be skipped
+    for rule in relevant_rules:
+        if check_rule_conditions(row, rule):
+            skipped_rules.update(rule.get('skip_rules', []))
+
+            action = get_rule_action(rule, field)
+            comment = get_rule_comment(rule)
+            if action:  # Only add if there's an action for this field
+                matched_rules.append({
+                    'status': action,
+                    'comment': comment,
+                    'rule_id': rule.get('id', 'unknown')
+                })
+
+    # Second pass: filter out skipped rules
+    filtered_matched_rules = [result for result in matched_rules if result['rule_id'] not in skipped_rules]
+    if filtered_matched_rules:
+        return aggregate_rule_results(filtered_matched_rules)
+
+    # No rules matched - return None to indicate no change should be made
+    return {'status': None, 'comment': '', 'rule_id': 'no_match'}
+
+
+def clean_comment_duplicates(comments, status):
+    """Clean duplicate status prefixes from comments while preserving the first one."""
+    if not comments:
+        return ""
+
+    cleaned_comments = []
+    first_comment = True
+
+    for comment in comments:
+        if first_comment:
+            # Keep the first comment as-is
+            cleaned_comments.append(comment)
+            first_comment = False
+        else:
+            # Remove any status prefixes from subsequent comments
+            cleaned_comment = comment
+            for pattern in ORIGINAL_COMMENT_PREFIXES:
+                if cleaned_comment.startswith(pattern):
+                    # Remove the prefix and any following "due to "
+                    remaining = cleaned_comment[len(pattern):].strip()
+                    if remaining.startswith("as "):
+                        cleaned_comment = remaining
+                    elif remaining.startswith("due to "):
+                        cleaned_comment = remaining[7:]
+                    else:
+                        cleaned_comment = remaining
+                    break
+            cleaned_comments.append(cleaned_comment)
+
+    return '; '.join(cleaned_comments)
+
+
+def aggregate_rule_results(matched_rules):
+    """Aggregate multiple rule results, prioritizing FAIL > FLAG > PASS.
+    If FAIL is present, only aggregate FAIL comments. Otherwise, aggregate FLAG and PASS comments in priority order.
+    """
+    priority_order = {'FAIL': 0, 'FLAG': 1, 'PASS': 2}
+    sorted_rules = sorted(matched_rules, key=lambda x: priority_order.get(x['status'], 3))
+    final_status = sorted_rules[0]['status']
+
+    if final_status == 'FAIL':
+        comments = [rule['comment'] for rule in matched_rules if rule['status'] == 'FAIL' and rule['comment']]
+        rule_ids = [rule['rule_id'] for rule in matched_rules if rule['status'] == 'FAIL']
+    else:
+        comments = [rule['comment'] for rule in sorted_rules if rule['status'] in ['FLAG', 'PASS'] and rule['comment']]
+        rule_ids = [rule['rule_id'] for rule in sorted_rules if rule['status'] in ['FLAG', 'PASS']]
+
+    return {
+        'status': final_status,
+        'comment': clean_comment_duplicates(comments, final_status),
+        'rule_id': ','.join(rule_ids)
+    }
+
+
+def determine_final_result(mms103_result, mms109_result, original_row):
+    """Combine the MMS103 and MMS109 results, propagating FAIL and keeping
+    the original values when no rule matched."""
+    mms103_status = mms103_result['status']
+    mms109_status = mms109_result['status']
+
+    original_mms103 = original_row.get('MMS103', 'PASS')
+    original_mms109 = original_row.get('MMS109', 'PASS')
+    original_comment = original_row.get('COMMENT', '')
+
+    final_mms103 = mms103_status if mms103_status is not None else original_mms103
+    final_mms109 = mms109_status if mms109_status is not None else original_mms109
+
+    # FAIL propagation only applies to a FAIL from a matched rule
+    mms103_rule_matched = mms103_status is not None
+    mms109_rule_matched = mms109_status is not None
+    if (mms103_rule_matched and final_mms103 == 'FAIL') or (mms109_rule_matched and final_mms109 == 'FAIL'):
+        final_mms103 = 'FAIL'
+        final_mms109 = 'FAIL'
+
+    final_test_qc = 'FAIL' if final_mms103 == 'FAIL' or final_mms109 == 'FAIL' else 'PASS'
+
+    comments = []
+    if mms103_result['comment'] and mms103_status is not None:
+        comments.append(mms103_result['comment'])
+    if mms109_result['comment'] and mms109_status is not None:
+        comments.append(mms109_result['comment'])
+    final_comment = '; '.join(comments) if comments else original_comment
+
+    return {
+        'mms103': final_mms103,
+        'mms109': final_mms109,
+        'test_qc': final_test_qc,
+        'comment': final_comment
+    }
+
+
+def curate_single_entry(row, rules):
+    """Curate one row with the raw rules, as the original CurationEngine did."""
+    mms103_result = evaluate_mms_rule(row, rules, 'MMS103')
+    mms109_result = evaluate_mms_rule(row, rules, 'MMS109')
+    final_result = determine_final_result(mms103_result, mms109_result, row)
+
+    result_row = row.copy()
+    result_row['MMS103'] = final_result['mms103']
+    result_row['MMS109'] = final_result['mms109']
+    result_row['TEST_QC'] = final_result['test_qc']
+    result_row['COMMENT'] = final_result['comment']
+    return result_row
@@ -0,0 +1,86 @@
+"""Per-row rule traces for auditing curation decisions.
+
+When rules are loaded each rule is given a bit numbered by its position in
+the ruleset. While a row is curated the engine ORs those bits into three
+integers: rules whose conditions were met, rules that were met but skipped
+by another rule's skip_rules, and rules whose actions were applied. Keeping
+the trace as three ints costs a few bit operations per rule, so it can stay
+on for whole production runs where verbose output would be far too slow.
+
+A trace is written either as an extra RULE_TRACE column of the curated CSV
+or to a sidecar CSV keyed by ISOLATE, with a legend mapping bits to rule IDs.
+"""
+
+import csv
+import os
+from .ruleset import rule_legend
+
+TRACE_COLUMN = 'RULE_TRACE'
+TRACE_FIELDS = ('ISOLATE', 'RULES_MET', 'RULES_SKIPPED', 'RULES_APPLIED')
+LEGEND_FIELDS = ('BIT', 'RULE_ID', 'DESCRIPTION')
+
+
+def format_trace(met, skipped, applied):
+    """Encode a trace as 'met/skipped/applied' hexadecimal masks."""
+    return f"{met:x}/{skipped:x}/{applied:x}"
+
+
+def parse_trace(text):
+    """Decode a RULE_TRACE value into (met, skipped, applied) masks.
+
+    Raises:
+        ValueError: If text is not three '/'-separated hexadecimal masks
+    """
+    parts = text.split('/')
+    if len(parts) != 3:
+        raise ValueError(f"Invalid rule trace '{text}'")
+    return tuple(int(part, 16) for part in parts)
+
+
+def decode_mask(mask, legend):
+    """Return the rule IDs whose bits are set in mask.
+
+    Args:
+        mask: Trace mask
+        legend: [(bit position, rule id)] as returned by rule_legend
+
+    Returns:
+        List of rule IDs in ruleset order
+    """
+    return [rule_id for bit, rule_id in legend if mask >> bit & 1]
+
+
+def legend_path(trace_file):
+    """Return the path of the legend written next to a sidecar trace file."""
+    base, _ = os.path.splitext(trace_file)
+    return f"{base}.rules.csv"
+
+
+def read_legend(path):
+    """Read a legend file written by TraceWriter into [(bit position, rule id)]."""
+    with open(path, 'r', newline='') as f:
+        return sorted((int(row['BIT']), row['RULE_ID']) for row in csv.DictReader(f))
+
+
+class TraceWriter:
+    """Stream per-row traces to a sidecar CSV and write its rule legend."""
+
+    def __init__(self, path, rules):
+        self.path = path
+        with open(legend_path(path), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(LEGEND_FIELDS)
+            descriptions = {rule.get('id'): rule.get('description', '') for rule in rules}
+            for bit, rule_id in rule_legend(rules):
+                writer.writerow((bit, rule_id, descriptions.get(rule_id, '')))
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(TRACE_FIELDS)
+
+    def add(self, isolate, trace):
+        """Append the (met, skipped, applied) trace of one row."""
+        met, skipped, applied = trace
+        self._writer.writerow((isolate, f"{met:x}", f"{skipped:x}", f"{applied:x}"))
+
+    def close(self):
+        self._file.close()
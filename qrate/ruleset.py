@@ -0,0 +1,487 @@
+"""Loading, validation and static analysis of QRate rulesets.
+
+Rules are validated when they are loaded so that typos in operators, missing
+condition keys and dangling ``skip_rules`` targets are reported up front
+instead of showing up as rules that silently never match.
+
+The static analysis gives every condition an estimated cost (relative units
+per row) and an estimated probability of being true. Because the conditions
+of a rule are a pure AND evaluated left to right, they can be reordered so
+that cheap, selective conditions run first without changing the outcome.
+"""
+
+import copy
+import os
+import yaml
+from .operators import (
+    OPERATOR_FIELDS, OPERATOR_MAPPINGS, find_mapping_file, get_operator, load_operator_plugins,
+)
+
+# Fields an action can set; the engine only reads these
+ACTION_FIELDS = ('MMS103', 'MMS109', 'COMMENT')
+STATUS_FIELDS = ('MMS103', 'MMS109')
+STATUS_VALUES = ('FAIL', 'FLAG', 'PASS')
+
+# Comment prefixes stripped from every comment but the first when comments
+# are combined, used when a ruleset does not declare its own
+DEFAULT_COMMENT_PREFIXES = (
+    "MMS103 FLAG",
+    "MMS103 Manual PASS",
+    "MMS109 FLAG",
+    "MMS109 Manual PASS",
+)
+# Key under which prepare_rules stores a rule's pre-split (prefix, body) comment
+COMMENT_PARTS_KEY = '_comment_parts'
+# Keys under which prepare_rules stores a rule's trace bit (1 << position in
+# the ruleset) and the OR of the bits of the rules it skips
+RULE_BIT_KEY = '_bit'
+SKIP_MASK_KEY = '_skip_mask'
+
+# Relative cost of evaluating one condition, in units of a string equality;
+# operators registered by plugins may give their own
+OPERATOR_COST = {
+    '==': 1.0,
+    '!=': 1.0,
+    '<': 2.0,
+    '<=': 2.0,
+    '>': 2.0,
+    '>=': 2.0,
+    'contains': 2.0,
+    'outside_pct': 5.0,
+    'genus_level_match': 4.0,
+    'species_subspecies_match': 4.0,
+    'species_different_genus_match': 6.0,
+    'species_genus_mismatch': 4.0,
+}
+# Extra cost for operators that look values up in a (cached) mapping file
+MAPPING_LOOKUP_COST = 3.0
+UNKNOWN_OPERATOR_COST = 1.0
+
+
+class RulesetError(ValueError):
+    """Raised when a ruleset fails validation."""
+
+    def __init__(self, issues):
+        self.issues = issues
+        errors = [issue for issue in issues if issue.severity == 'error']
+        super().__init__(f"{len(errors)} error(s) in ruleset: " + '; '.join(str(issue) for issue in errors))
+
+
+class RuleIssue:
+    """A single problem found while validating a ruleset."""
+
+    def __init__(self, severity, rule_id, message):
+        self.severity = severity
+        self.rule_id = rule_id
+        self.message = message
+
+    def __str__(self):
+        return f"{self.rule_id}: {self.message}"
+
+    def __repr__(self):
+        return f"RuleIssue({self.severity!r}, {self.rule_id!r}, {self.message!r})"
+
+
+def load_rules(rules_file, validate=True):
+    """Load a rules YAML file, validate it and pre-split its comment templates.
+
+    A rules file is either a list of rules, or a mapping with a ``rules`` list
+    and optional ``comment_prefixes`` list.
+
+    Args:
+        rules_file: Path to the rules YAML file
+        validate: Raise RulesetError if the ruleset has errors
+
+    Returns:
+        Tuple of (rules, issues) where issues lists every warning and error found
+    """
+    with open(rules_file, 'r') as f:
+        document = yaml.safe_load(f)
+
+    # Operators from plugins must be registered before the rules are validated
+    issues = [RuleIssue('warning', '<plugins>', message) for message in load_operator_plugins()]
+    comment_prefixes = DEFAULT_COMMENT_PREFIXES
+    if document is None:
+        rules = []
+    elif isinstance(document, dict):
+        rules = document.get('rules', [])
+        if 'comment_prefixes' in document:
+            comment_prefixes = document['comment_prefixes']
+            if (not isinstance(comment_prefixes, list)
+                    or not all(isinstance(p, str) and p for p in comment_prefixes)):
+                issues.append(RuleIssue('error', '<ruleset>', "comment_prefixes must be a list of non-empty strings"))
+                comment_prefixes = DEFAULT_COMMENT_PREFIXES
+    else:
+        rules = document
+
+    issues.extend(validate_rules(rules))
+    issues.sort(key=lambda issue: 0 if issue.severity == 'error' else 1)
+    if validate and any(issue.severity == 'error' for issue in issues):
+        raise RulesetError(issues)
+    if isinstance(rules, list):
+        rules = prepare_rules(rules, comment_prefixes)
+    return rules, issues
+
+
+def split_comment(comment, comment_prefixes):
+    """Split a comment into (prefix, body) using the first matching prefix.
+
+    The body is what remains once the prefix and any leading "due to " are
+    removed; it is used for every comment after the first when comments from
+    several rules are combined. Comments without a known prefix have an empty
+    prefix and are their own body.
+    """
+    for prefix in comment_prefixes:
+        if comment.startswith(prefix):
+            body = comment[len(prefix):].strip()
+            if body.startswith("due to "):
+                body = body[7:]
+            return prefix, body
+    return '', comment
+
+
+def prepare_rules(rules, comment_prefixes=DEFAULT_COMMENT_PREFIXES):
+    """Return copies of rules with per-rule data precomputed at load time.
+
+    Each rule gets its COMMENT template split once into (prefix, body), a
+    trace bit numbered by its position in the ruleset, and a mask of the
+    bits of its skip_rules targets.
+    """
+    bits = {}
+    for position, rule in enumerate(rules):
+        if isinstance(rule, dict) and rule.get('id') not in bits:
+            bits[rule.get('id')] = 1 << position
+
+    prepared = []
+    for position, rule in enumerate(rules):
+        if isinstance(rule, dict):
+            rule = copy.copy(rule)
+            rule[RULE_BIT_KEY] = 1 << position
+            skip_mask = 0
+            for target in rule.get('skip_rules', []) or []:
+                skip_mask |= bits.get(target, 0)
+            rule[SKIP_MASK_KEY] = skip_mask
+            comment = ''
+            for action in rule.get('actions', []) or []:
+                if isinstance(action, dict) and action.get('field') == 'COMMENT':
+                    comment = action.get('value', '')
+                    break
+            if isinstance(comment, str):
+                rule[COMMENT_PARTS_KEY] = split_comment(comment, comment_prefixes)
+        prepared.append(rule)
+    return prepared
+
+
+def rule_legend(rules):
+    """Return [(bit position, rule id)] for rules prepared by prepare_rules."""
+    legend = []
+    for rule in rules:
+        if isinstance(rule, dict) and rule.get(RULE_BIT_KEY):
+            legend.append((rule[RULE_BIT_KEY].bit_length() - 1, rule.get('id', 'unknown')))
+    return sorted(legend)
+
+
+def validate_rules(rules, fieldnames=None):
+    """Check a ruleset for problems that would make rules misbehave.
+
+    Args:
+        rules: List of rule dictionaries as loaded from YAML
+        fieldnames: Optional CSV header to check condition fields against
+
+    Returns:
+        List of RuleIssue objects, errors first
+    """
+    issues = []
+    if not isinstance(rules, list):
+        return [RuleIssue('error', '<ruleset>', "ruleset must be a list of rules")]
+
+    def error(rule_id, message):
+        issues.append(RuleIssue('error', rule_id, message))
+
+    def warning(rule_id, message):
+        issues.append(RuleIssue('warning', rule_id, message))
+
+    rule_ids = set()
+    mapping_status = {}
+
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            error(f"<rule {index + 1}>", "rule must be a mapping")
+            continue
+
+        rule_id = rule.get('id')
+        if not rule_id:
+            rule_id = f"<rule {index + 1}>"
+            error(rule_id, "rule has no id")
+        elif rule_id in rule_ids:
+            error(rule_id, "duplicate rule id")
+        rule_ids.add(rule_id)
+
+        actions = rule.get('actions', [])
+        if not isinstance(actions, list):
+            error(rule_id, "actions must be a list")
+            actions = []
+        status_actions = 0
+        for action in actions:
+            if not isinstance(action, dict) or 'field' not in action:
+                error(rule_id, "every action needs a field")
+                continue
+            action_field = action.get('field')
+            if action_field not in ACTION_FIELDS:
+                warning(rule_id, f"action field '{action_field}' is ignored by the engine")
+            elif action_field in STATUS_FIELDS:
+                status_actions += 1
+                if action.get('value') not in STATUS_VALUES:
+                    error(rule_id, f"{action_field} action value '{action.get('value')}' is not one of {', '.join(STATUS_VALUES)}")
+        if not status_actions:
+            warning(rule_id, "rule has no MMS103 or MMS109 action and will never be applied")
+
+        conditions = rule.get('conditions', [])
+        if not isinstance(conditions, list):
+            error(rule_id, "conditions must be a list")
+            conditions = []
+        if not conditions:
+            warning(rule_id, "rule has no conditions and matches every row")
+
+        for position, condition in enumerate(conditions, 1):
+            where = f"condition {position}"
+            if not isinstance(condition, dict):
+                error(rule_id, f"{where} must be a mapping")
+                continue
+
+            field = condition.get('field')
+            operator = condition.get('operator')
+            value = condition.get('value')
+            if not field:
+                error(rule_id, f"{where} has no field")
+            registered = get_operator(operator)
+            if registered is None:
+                error(rule_id, f"{where} uses unknown operator '{operator}'")
+                continue
+
+            if registered.boolean and not isinstance(value, bool):
+                error(rule_id, f"{where} operator '{operator}' needs value true or false, got {value!r}")
+            elif registered.numeric:
+                try:
+                    float(value)
+                except (TypeError, ValueError):
+                    error(rule_id, f"{where} operator '{operator}' needs a numeric value, got {value!r}")
+            elif 'value' not in condition:
+                error(rule_id, f"{where} has no value")
+
+            if operator == 'outside_pct':
+                for bound in ('min_field', 'max_field'):
+                    if not condition.get(bound):
+                        error(rule_id, f"{where} operator 'outside_pct' needs {bound}")
+                try:
+                    float(condition.get('pct', 0.1))
+                except (TypeError, ValueError):
+                    error(rule_id, f"{where} pct {condition.get('pct')!r} is not a number")
+
+            mapping_name = OPERATOR_MAPPINGS.get(operator)
+            if mapping_name:
+                if mapping_name not in mapping_status:
+                    mapping_status[mapping_name] = _check_mapping_file(mapping_name)
+                if mapping_status[mapping_name]:
+                    error(rule_id, f"{where} references {mapping_name}: {mapping_status[mapping_name]}")
+
+    for rule in rules:
+        if not isinstance(rule, dict):
+            continue
+        skip_rules = rule.get('skip_rules', [])
+        if not isinstance(skip_rules, list):
+            error(rule.get('id', '<rule>'), "skip_rules must be a list")
+            continue
+        for target in skip_rules:
+            if target not in rule_ids:
+                error(rule.get('id', '<rule>'), f"skip_rules target '{target}' does not exist")
+            elif target == rule.get('id'):
+                warning(rule.get('id'), "rule skips itself")
+
+    if fieldnames is not None:
+        issues.extend(check_condition_fields(rules, fieldnames))
+    issues.sort(key=lambda issue: 0 if issue.severity == 'error' else 1)
+    return issues
+
+
+def check_condition_fields(rules, fieldnames):
+    """Warn about condition fields missing from an input header.
+
+    A condition on a column the input does not have is never met, so a
+    misspelled field silently disables its rule.
+
+    Args:
+        rules: List of rule dictionaries
+        fieldnames: CSV header, plus any joined NAME.COLUMN fields
+
+    Returns:
+        List of warning RuleIssue objects, one per missing column
+    """
+    issues = []
+    known_fields = set(fieldnames)
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not isinstance(rule.get('conditions', []), list):
+            continue
+        rule_id = rule.get('id') or f"<rule {index + 1}>"
+        for position, condition in enumerate(rule.get('conditions', []), 1):
+            if not isinstance(condition, dict):
+                continue
+            operator = condition.get('operator')
+            referenced = [condition.get('field')] + list(OPERATOR_FIELDS.get(operator, ()))
+            if operator == 'outside_pct':
+                referenced += [condition.get('min_field'), condition.get('max_field')]
+            for name in referenced:
+                if name and isinstance(name, str) and name not in known_fields:
+                    issues.append(RuleIssue('warning', rule_id, f"condition {position} reads column '{name}' "
+                                                                f"which is not in the input header"))
+                    known_fields.add(name)  # report each missing column once
+    return issues
+
+
+def _check_mapping_file(mapping_name):
+    """Return an error message if a mapping file cannot be used, else None."""
+    path = find_mapping_file(mapping_name)
+    if not os.path.exists(path):
+        return "mapping file not found"
+    try:
+        with open(path, 'r') as f:
+            mapping = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        return f"mapping file does not parse ({e})"
+    if not isinstance(mapping, dict) or not mapping:
+        return "mapping file is empty or not a mapping"
+    return None
+
+
+def estimate_condition_cost(condition):
+    """Estimate the per-row cost of evaluating a condition, in relative units."""
+    operator = condition.get('operator')
+    cost = OPERATOR_COST.get(operator)
+    if cost is None:
+        registered = get_operator(operator)
+        cost = registered.cost if registered is not None and registered.cost is not None else UNKNOWN_OPERATOR_COST
+    if operator in OPERATOR_MAPPINGS:
+        cost += MAPPING_LOOKUP_COST
+    return cost
+
+
+def estimate_condition_selectivity(condition):
+    """Estimate the probability that a condition is true for a typical row.
+
+    These are static heuristics: equality against a specific string is rare,
+    boolean test columns split roughly evenly, and species relationships hold
+    for a small share of rows.
+    """
+    operator = condition.get('operator')
+    value = condition.get('value')
+    registered = get_operator(operator)
+
+    if operator == '==':
+        return 0.5 if isinstance(value, bool) else 0.1
+    if operator == '!=':
+        return 0.5 if isinstance(value, bool) else 0.9
+    if registered is not None and registered.numeric:
+        return 0.5
+    if operator == 'contains':
+        return 0.2
+    if registered is not None and registered.boolean:
+        if operator == 'species_scheme_compatible':
+            positive = 0.8
+        elif operator == 'outside_pct':
+            positive = 0.2
+        else:
+            positive = 0.1
+        return positive if value is True else 1 - positive
+    return 0.5
+
+
+def condition_rank(condition):
+    """Ordering key for AND conditions: expected cost per row rejected.
+
+    The optimal order for a conjunction of independent predicates sorts them
+    by cost / P(false), so conditions that are cheap and usually false go first.
+    """
+    p_false = 1 - estimate_condition_selectivity(condition)
+    return estimate_condition_cost(condition) / max(p_false, 1e-6)
+
+
+def estimate_rule_cost(conditions):
+    """Expected cost of evaluating conditions in order with short-circuiting."""
+    cost = 0.0
+    p_reached = 1.0
+    for condition in conditions:
+        cost += p_reached * estimate_condition_cost(condition)
+        p_reached *= estimate_condition_selectivity(condition)
+    return cost
+
+
+def optimize_rules(rules):
+    """Return a copy of rules with conditions reordered cheapest and most selective first.
+
+    Conditions within a rule are a pure AND, so evaluation order does not
+    affect whether the rule matches. The original rules are not modified.
+    """
+    optimized = []
+    for rule in rules:
+        rule = copy.copy(rule)
+        conditions = rule.get('conditions')
+        if isinstance(conditions, list) and len(conditions) > 1:
+            # sorted() is stable, so equally ranked conditions keep YAML order
+            rule['conditions'] = sorted(conditions, key=condition_rank)
+        optimized.append(rule)
+    return optimized
+
+
+def format_condition(condition):
+    """Render a condition as a short human readable string."""
+    text = f"{condition.get('field')} {condition.get('operator')} {condition.get('value')!r}"
+    if condition.get('operator') == 'outside_pct':
+        text += f" [{condition.get('min_field')}..{condition.get('max_field')} ±{condition.get('pct', 0.1)}]"
+    return text
+
+
+def format_analysis(rules, issues):
+    """Build the report printed by `qrate validate`."""
+    lines = []
+    optimized = optimize_rules(rules) if isinstance(rules, list) else []
+    total_before = 0.0
+    total_after = 0.0
+
+    for original, rule in zip(rules if isinstance(rules, list) else [], optimized):
+        if not isinstance(rule, dict):
+            continue
+        conditions = rule.get('conditions') or []
+        original_conditions = original.get('conditions') or []
+        before = estimate_rule_cost(original_conditions) if isinstance(original_conditions, list) else 0.0
+        after = estimate_rule_cost(conditions) if isinstance(conditions, list) else 0.0
+        total_before += before
+        total_after += after
+
+        fields = ','.join(a.get('field') for a in rule.get('actions', [])
+                          if isinstance(a, dict) and a.get('field') in STATUS_FIELDS)
+        reordered = " (reordered)" if conditions != original_conditions else ""
+        lines.append(f"{rule.get('id', '<no id>')} [{fields or 'no status action'}]")
+        lines.append(f"  estimated cost: {before:.1f} -> {after:.1f}{reordered}")
+        if isinstance(conditions, list):
+            for condition in conditions:
+                if not isinstance(condition, dict):
+                    continue
+                lines.append(
+                    f"    - {format_condition(condition)}"
+                    f"  (cost {estimate_condition_cost(condition):.0f},"
+                    f" p(true) {estimate_condition_selectivity(condition):.2f})"
+                )
+        skip_rules = rule.get('skip_rules')
+        if skip_rules:
+            lines.append(f"  skips: {', '.join(str(s) for s in skip_rules)}")
+
+    lines.append("")
+    lines.append(f"Rules: {len(optimized)}")
+    lines.append(f"Estimated cost per row: {total_before:.1f} -> {total_after:.1f} after reordering")
+
+    errors = [issue for issue in issues if issue.severity == 'error']
+    warnings = [issue for issue in issues if issue.severity == 'warning']
+    lines.append(f"Errors: {len(errors)}, warnings: {len(warnings)}")
+    for issue in issues:
+        lines.append(f"  {issue.severity.upper()}: {issue}")
+    return '\n'.join(lines)
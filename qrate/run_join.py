@@ -0,0 +1,218 @@
+"""Joining other run sheets, such as NTC and speciation files, onto QC rows.
+
+Each joined sheet is given a name, and its columns are added to the QC row
+with the same isolate as ``NAME.COLUMN`` (e.g. ``NTC.READS``), so rules can
+compare them like any QC column. This is a left join: every QC row is kept
+once, in input order. A QC row without a matching row in a sheet gets none of
+its columns, so conditions on them are not met. When a sheet has several
+rows for one isolate, the first is used and the rest are counted as
+duplicates.
+
+By default each sheet is read into a hash table keyed by isolate. When the
+QC sheet and every joined sheet are sorted by isolate, a merge join streams
+the joined sheets instead and holds one row of each in memory; rows found
+out of order stop the run with a JoinError. The QC rows themselves are
+whatever the caller passes in, which for the qrate command is the whole
+sheet read into a list.
+"""
+
+import csv
+from . import telemetry
+
+DEFAULT_JOIN_KEY = 'ISOLATE'
+# Separator between a joined sheet's name and its column names
+FIELD_SEPARATOR = '.'
+
+
+class JoinError(ValueError):
+    """Raised when run sheets cannot be joined as requested."""
+
+
+class JoinSource:
+    """A sheet joined onto QC rows, and counts of how its rows matched."""
+
+    def __init__(self, name, path, key=DEFAULT_JOIN_KEY):
+        self.name = name
+        self.path = path
+        self.key = key
+        self.fieldnames = None
+        self.matched = 0
+        self.unmatched = 0
+        self.duplicates = 0
+
+    def read_fieldnames(self):
+        """Read and check the sheet's header.
+
+        Raises:
+            OSError: If the sheet cannot be read
+            JoinError: If the sheet has no key column
+        """
+        if self.fieldnames is None:
+            with open(self.path, 'r', newline='') as f:
+                fieldnames = next(csv.reader(f), [])
+            if self.key not in fieldnames:
+                raise JoinError(f"Join sheet {self.path} has no {self.key} column")
+            self.fieldnames = fieldnames
+        return self.fieldnames
+
+    def joined_fieldnames(self):
+        """Names of the columns added to QC rows, e.g. NTC.READS."""
+        return [f"{self.name}{FIELD_SEPARATOR}{column}" for column in self.read_fieldnames()]
+
+    def summary(self):
+        text = f"{self.name}: {self.matched} rows matched, {self.unmatched} without a {self.name} row"
+        if self.duplicates:
+            text += f", {self.duplicates} duplicate {self.key} values ignored"
+        return text
+
+
+def parse_join_spec(spec, key=DEFAULT_JOIN_KEY):
+    """Parse a NAME=PATH join argument into a JoinSource.
+
+    Raises:
+        JoinError: If the argument is not NAME=PATH
+    """
+    name, separator, path = spec.partition('=')
+    name = name.strip()
+    if not separator or not name or not path:
+        raise JoinError(f"Join '{spec}' must be NAME=PATH, e.g. NTC=run/ntc.csv")
+    if FIELD_SEPARATOR in name:
+        raise JoinError(f"Join name '{name}' must not contain '{FIELD_SEPARATOR}'")
+    return JoinSource(name, path, key)
+
+
+def check_sources(sources):
+    """Check join names are unique and every sheet has the key column."""
+    names = set()
+    for source in sources:
+        if source.name in names:
+            raise JoinError(f"Join name '{source.name}' is used more than once")
+        names.add(source.name)
+        source.read_fieldnames()
+
+
+def _joined_values(source, row):
+    prefix = source.name + FIELD_SEPARATOR
+    return {prefix + column: value for column, value in row.items() if column is not None}
+
+
+def _row_key(row, key):
+    return (row.get(key) or '').strip()
+
+
+def hash_join(rows, source, key=DEFAULT_JOIN_KEY):
+    """Add a sheet's columns to rows by key, reading the sheet into a hash table.
+
+    Args:
+        rows: Iterable of QC row dictionaries, updated in place
+        source: JoinSource to join
+        key: QC column matched against the sheet's key column
+
+    Yields:
+        The QC rows, in order
+    """
+    table = {}
+    with open(source.path, 'r', newline='') as f:
+        for side_row in csv.DictReader(f):
+            side_key = _row_key(side_row, source.key)
+            if side_key in table:
+                source.duplicates += 1
+                continue
+            table[side_key] = _joined_values(source, side_row)
+
+    for row in rows:
+        values = table.get(_row_key(row, key))
+        if values is None:
+            source.unmatched += 1
+        else:
+            row.update(values)
+            source.matched += 1
+        yield row
+
+
+def merge_join(rows, source, key=DEFAULT_JOIN_KEY):
+    """Add a sheet's columns to rows by key, streaming both in key order.
+
+    Args:
+        rows: Iterable of QC row dictionaries sorted by key, updated in place
+        source: JoinSource sorted by its key column
+        key: QC column matched against the sheet's key column
+
+    Yields:
+        The QC rows, in order
+
+    Raises:
+        JoinError: If the rows or the sheet are not sorted by key
+    """
+    with open(source.path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        line = 1
+
+        def advance(previous_key):
+            nonlocal line
+            side_row = next(reader, None)
+            line += 1
+            if side_row is None:
+                return None, None
+            side_key = _row_key(side_row, source.key)
+            if previous_key is not None:
+                if side_key < previous_key:
+                    raise JoinError(f"{source.path} is not sorted by {source.key}: "
+                                    f"{side_key!r} on line {line} follows {previous_key!r}")
+                if side_key == previous_key:
+                    source.duplicates += 1
+            return side_row, side_key
+
+        side_row, side_key = advance(None)
+        previous_qc_key = None
+        for row in rows:
+            qc_key = _row_key(row, key)
+            if previous_qc_key is not None and qc_key < previous_qc_key:
+                raise JoinError(f"QC rows are not sorted by {key}: {qc_key!r} follows {previous_qc_key!r}")
+            previous_qc_key = qc_key
+            # Skip sheet rows for isolates before this one, including duplicates
+            while side_row is not None and side_key < qc_key:
+                side_row, side_key = advance(side_key)
+            if side_row is not None and side_key == qc_key:
+                row.update(_joined_values(source, side_row))
+                source.matched += 1
+            else:
+                source.unmatched += 1
+            yield row
+
+        # Read the rest of the sheet to check its order and count duplicates
+        while side_row is not None:
+            side_row, side_key = advance(side_key)
+
+
+def join_rows(rows, sources, key=DEFAULT_JOIN_KEY, sorted_inputs=False):
+    """Join every source onto QC rows.
+
+    Args:
+        rows: Iterable of QC row dictionaries, updated in place
+        sources: JoinSource instances, joined in order
+        key: QC column matched against each sheet's key column
+        sorted_inputs: Merge join sheets sorted by key instead of hashing them
+
+    Returns:
+        Iterator over the joined rows
+    """
+    join = merge_join if sorted_inputs else hash_join
+    for source in sources:
+        rows = join(rows, source, key)
+    return rows
+
+
+def read_joined(rows, sources, key=DEFAULT_JOIN_KEY, sorted_inputs=False):
+    """Join sources onto a list of QC rows and return the list.
+
+    Raises:
+        JoinError: If the QC rows have no key column, or sorted inputs are out of order
+    """
+    if rows and key not in rows[0]:
+        raise JoinError(f"QC sheet has no {key} column to join on")
+    with telemetry.span('join', sheets=','.join(source.name for source in sources)):
+        joined = list(join_rows(rows, sources, key, sorted_inputs))
+    if telemetry.active is not None:
+        telemetry.active.add('qrate_rows_total', len(joined), stage='join')
+    return joined
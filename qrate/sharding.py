@@ -0,0 +1,263 @@
+"""Sharded, resumable curation for very large QC sheets.
+
+The input is streamed in shards of a fixed number of rows. Each curated shard
+is written to a checkpoint directory as soon as it is finished and recorded in
+a manifest, so a run that dies halfway can be restarted and will skip the
+shards it already completed. Once every shard is done they are concatenated
+into the final curated CSV, byte-for-byte identical to a single-pass run.
+
+Shards are independent, so they double as work units for curating with
+several worker processes.
+"""
+
+import csv
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .curation_engine import CurationEngine, CURATED_FIELDS
+from .rule_trace import TRACE_COLUMN
+from .operators import get_species_index, load_operator_plugins
+from . import telemetry
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+DEFAULT_SHARD_SIZE = 50000
+# Files a checkpoint creates; nothing else in its directory is ever removed
+CHECKPOINT_PATTERNS = ('shard-*.csv', 'shard-*.csv.tmp', MANIFEST_NAME, f"{MANIFEST_NAME}.tmp")
+
+
+class CheckpointError(RuntimeError):
+    """Raised when a checkpoint directory cannot be used safely."""
+
+
+def default_checkpoint_dir(output_file):
+    """Return the checkpoint directory used for an output file."""
+    return f"{output_file}.shards"
+
+
+def curated_fieldnames(fieldnames, trace_column=False):
+    """Columns of curated output for an input header, matching write_csv."""
+    extra = CURATED_FIELDS + (TRACE_COLUMN,) if trace_column else CURATED_FIELDS
+    return list(fieldnames) + [field for field in extra if field not in fieldnames]
+
+
+def iter_shards(input_file, shard_size):
+    """Stream (index, rows) shards of at most shard_size rows from a CSV file."""
+    with open(input_file, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        shard = []
+        index = 0
+        for row in reader:
+            shard.append(row)
+            if len(shard) >= shard_size:
+                yield index, shard
+                index += 1
+                shard = []
+        if shard:
+            yield index, shard
+
+
+def read_fieldnames(input_file):
+    """Return the header of a CSV file."""
+    with open(input_file, 'r', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def rules_fingerprint(rules):
+    """Hash of a ruleset, used to tell whether checkpoints are still valid."""
+    encoded = json.dumps(rules, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ShardCheckpoint:
+    """Checkpoint directory holding curated shards and their manifest."""
+
+    def __init__(self, directory, input_file, rules, shard_size, fieldnames=None):
+        self.directory = directory
+        stat = os.stat(input_file)
+        self.identity = {
+            'version': MANIFEST_VERSION,
+            'input': os.path.abspath(input_file),
+            'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns,
+            'rules_sha256': rules_fingerprint(rules),
+            'shard_size': shard_size,
+            'fieldnames': list(fieldnames or []),
+        }
+        self.shards = {}
+        self.resumed = self.load()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def shard_path(self, index):
+        return os.path.join(self.directory, f"shard-{index:06d}.csv")
+
+    def load(self):
+        """Load a compatible manifest; start a fresh checkpoint otherwise.
+
+        Returns:
+            True if completed shards from an earlier run will be reused
+
+        Raises:
+            CheckpointError: If the directory holds files but no checkpoint manifest
+        """
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if not (isinstance(manifest, dict) and 'rules_sha256' in manifest and 'shards' in manifest):
+            manifest = None
+
+        if manifest and all(manifest.get(key) == value for key, value in self.identity.items()):
+            self.shards = {
+                int(index): info for index, info in manifest.get('shards', {}).items()
+                if os.path.exists(self.shard_path(int(index)))
+            }
+            return bool(self.shards)
+
+        if manifest is None and os.path.isdir(self.directory) and os.listdir(self.directory):
+            raise CheckpointError(f"{self.directory} is not empty and is not a QRate checkpoint directory")
+
+        # Input or rules changed since the checkpoint was written
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        self.shards = {}
+        self.save()
+        return False
+
+    def save(self):
+        manifest = dict(self.identity)
+        manifest['shards'] = {str(index): info for index, info in sorted(self.shards.items())}
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_complete(self, index):
+        return index in self.shards
+
+    def write_shard(self, index, rows, fieldnames):
+        """Write a curated shard (without header) and record it in the manifest."""
+        path = self.shard_path(index)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+        self.shards[index] = {'rows': len(rows)}
+        self.save()
+
+    def finalize(self, output_file, shard_count, fieldnames):
+        """Concatenate shards 0..shard_count-1 into output_file under one header."""
+        missing = [index for index in range(shard_count) if index not in self.shards]
+        if missing:
+            raise RuntimeError(f"Cannot assemble output, shards not curated: {missing[:10]}")
+
+        tmp_path = f"{output_file}.tmp"
+        with open(tmp_path, 'w', newline='') as out:
+            csv.DictWriter(out, fieldnames=fieldnames).writeheader()
+        with open(tmp_path, 'ab') as out:
+            for index in range(shard_count):
+                with open(self.shard_path(index), 'rb') as shard:
+                    shutil.copyfileobj(shard, out)
+        os.replace(tmp_path, output_file)
+
+    def clear(self):
+        """Delete the shards, manifest and temporary files this checkpoint created."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in CHECKPOINT_PATTERNS):
+                os.remove(os.path.join(self.directory, name))
+
+    def remove(self):
+        """Delete the checkpoint's files, and its directory if nothing else is left."""
+        self.clear()
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+_worker_engine = None
+
+
+def _init_worker(rules, trace_column=False):
+    global _worker_engine
+    # Spawned workers start with only the built-in operators registered
+    load_operator_plugins()
+    _worker_engine = CurationEngine(rules, trace_column=trace_column)
+
+
+def _curate_shard(index, rows):
+    return index, _worker_engine.curate_data(rows)
+
+
+def curate_sharded(input_file, output_file, engine, shard_size=DEFAULT_SHARD_SIZE,
+                   checkpoint_dir=None, workers=1, keep_shards=False):
+    """Curate a CSV file shard by shard, resuming from an earlier checkpoint.
+
+    Args:
+        input_file: Path to the QC CSV file
+        output_file: Path of the final curated CSV
+        engine: CurationEngine used for serial curation; its rules are sent
+            to worker processes when workers > 1
+        shard_size: Rows per shard
+        checkpoint_dir: Directory for shards and manifest (default: <output>.shards)
+        workers: Number of worker processes; 1 curates in this process
+        keep_shards: Keep the checkpoint directory after assembling the output
+
+    Returns:
+        Dictionary with total rows, rows curated in this run, shard count and
+        shards reused from a checkpoint
+    """
+    fieldnames = curated_fieldnames(read_fieldnames(input_file), engine.trace_column)
+    checkpoint = ShardCheckpoint(checkpoint_dir or default_checkpoint_dir(output_file),
+                                 input_file, engine.rules, shard_size, fieldnames)
+    stats = {'rows': 0, 'shards': 0, 'reused': 0, 'curated': 0}
+
+    def pending_shards():
+        for index, rows in iter_shards(input_file, shard_size):
+            stats['shards'] = index + 1
+            stats['rows'] += len(rows)
+            if checkpoint.is_complete(index):
+                stats['reused'] += 1
+                continue
+            stats['curated'] += len(rows)
+            yield index, rows
+
+    with telemetry.span('curate_sharded', shard_size=shard_size, workers=workers):
+        if workers > 1:
+            # Build the species index before forking so workers share its pages
+            get_species_index()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(engine.rules, engine.trace_column)) as executor:
+                in_flight = set()
+                for index, rows in pending_shards():
+                    # Bound memory by keeping a couple of shards queued per worker
+                    if len(in_flight) >= workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            checkpoint.write_shard(*future.result(), fieldnames)
+                    in_flight.add(executor.submit(_curate_shard, index, rows))
+                for future in in_flight:
+                    checkpoint.write_shard(*future.result(), fieldnames)
+            if telemetry.active is not None:
+                telemetry.active.add('qrate_rows_total', stats['curated'], stage='curate')
+        else:
+            for index, rows in pending_shards():
+                checkpoint.write_shard(index, engine.curate_data(rows), fieldnames)
+
+    # Like write_csv, an input without rows produces no output file
+    if stats['rows']:
+        with telemetry.span('assemble_shards', shards=stats['shards']):
+            checkpoint.finalize(output_file, stats['shards'], fieldnames)
+    if not keep_shards:
+        checkpoint.remove()
+    return stats
@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 
 import csv
+import fnmatch
+import os
+import re
 import sys
+import time
+import yaml
 from datetime import datetime
+from .operators import find_mapping_file
+from . import telemetry
+
+RECOMMENDATIONS_FILE = 'species_recommendations.yaml'
 
 def log_with_timestamp(message, file=None):
     """Print message with timestamp prefix."""
@@ -10,17 +19,92 @@ def log_with_timestamp(message, file=None):
     formatted_message = f"[{timestamp}] {message}"
     print(formatted_message, file=file)
 
+def load_recommendations(recommendations_file=None):
+    """Load the species recommendation mapping.
+
+    Args:
+        recommendations_file: Path to a recommendations YAML file
+            (default: built-in species_recommendations.yaml)
+
+    Returns:
+        Dictionary with 'run_files' (list of expected files) and 'species'
+        (species -> {'message', 'files'}), in file order
+    """
+    path = recommendations_file or find_mapping_file(RECOMMENDATIONS_FILE)
+    with open(path, 'r') as f:
+        mapping = yaml.safe_load(f) or {}
+    species = {}
+    for name, entry in (mapping.get('species') or {}).items():
+        entry = entry or {}
+        species[str(name)] = {'message': entry.get('message', ''), 'files': entry.get('files') or []}
+    return {'run_files': mapping.get('run_files') or [], 'species': species}
+
+
+def glob_literal(pattern):
+    """Return the longest run of plain characters in a glob, used to find candidate names."""
+    plain = re.sub(r'\[[^\]]*\]', '*', pattern)
+    return max(re.split(r'[*?]', plain), key=len)
+
+
+class RunFileIndex:
+    """Index of the file names below a run directory, built with a single scan.
+
+    Names are stored lower-cased and joined into one newline-separated string.
+    A glob is matched by searching that string for its longest literal part,
+    so only the few names containing it are compared against the full glob.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                self.entries.setdefault(name.lower(), []).append((root, name))
+        self.file_count = sum(len(entries) for entries in self.entries.values())
+        self._names = '\n'.join(self.entries)
+        self._matches = {}
+
+    def _match_names(self, pattern):
+        match = re.compile(fnmatch.translate(pattern)).match
+        literal = glob_literal(pattern)
+        if not literal:
+            return [name for name in self.entries if match(name)]
+
+        names = self._names
+        matched = []
+        position = names.find(literal)
+        while position != -1:
+            start = names.rfind('\n', 0, position) + 1
+            end = names.find('\n', position)
+            if end == -1:
+                end = len(names)
+            name = names[start:end]
+            if match(name):
+                matched.append(name)
+            position = names.find(literal, end)
+        return matched
+
+    def find(self, patterns):
+        """Return the paths whose file name matches any of the globs (case-insensitive)."""
+        # A dict keeps the first-match order and drops paths matched by several patterns
+        found = {}
+        for pattern in patterns:
+            pattern = pattern.lower()
+            matches = self._matches.get(pattern)
+            if matches is None:
+                matches = self._matches[pattern] = [
+                    os.path.join(root, name) for key in self._match_names(pattern) for root, name in self.entries[key]
+                ]
+            found.update(dict.fromkeys(matches))
+        return list(found)
+
+
 class SpeciesChecker:
     """Species checker for QC CSV files."""
     
-    def __init__(self):
-        self.species_list = [
-            "Salmonella", "Listeria monocytogenes", "Escherichia coli",
-            "Streptococcus pneumoniae", "Streptococcus pyogenes", 
-            "Neisseria meningitidis", "Legionella pneumophila", 
-            "Neisseria gonorrhoeae", "Mycobacterium tuberculosis",
-            "Haemophilus influenzae"
-        ]
+    def __init__(self, recommendations_file=None):
+        self.recommendations = load_recommendations(recommendations_file)
+        self.species_list = list(self.recommendations['species'])
     
     def count_species_in_file(self, file_path):
         """Count occurrences of each species in the CSV file."""
@@ -65,37 +149,76 @@ class SpeciesChecker:
     def print_species_recommendations(self, species_count):
         """Print recommendations for each detected species."""
         print("\n---\nExpected files:")
-        print("* QC file")
-        print("* 2 NTC files")
-        print("* 1 Sequence report file")
-        print("* 1 Speciation file")
-        print("* MMS118 (AMR)")
-
-        for species in self.species_list:
-            if species_count[species] > 0:
-                if species == "Salmonella":
-                    print("Check for sistr typing file, MMS184 (Salmonella AMR), and MMS181 (Salmonella cgMLST)")
-                elif species == "Listeria monocytogenes":
-                    print("Check for lissero typing file")
-                elif species == "Escherichia coli":
-                    print("Check for EcOH typing file")
-                elif species == "Streptococcus pneumoniae":
-                    print("Check for seroba typing file")
-                elif species == "Streptococcus pyogenes":
-                    print("Check for emmtyper typing file")
-                elif species == "Neisseria meningitidis":
-                    print("Check for meningotyper typing file")
-                elif species == "Legionella pneumophila":
-                    print("Check for MMS123LpSBT typing file")
-                elif species == "Neisseria gonorrhoeae":
-                    print("Check for MMS181 (Neisseria gonorrhoeae cgMLST) and ngmaster typing file")
-                elif species == "Mycobacterium tuberculosis":
-                    print("Check for MMS155 (M. tuberculosis AMR)")
-                elif species == "Haemophilus influenzae":
-                    print("Check for BIS009 hicap typing file")
-
-    def check_species(self, file_path, verbose=False):
-        """Main method to check species in QC file."""
+        for entry in self.recommendations['run_files']:
+            print(f"* {entry.get('label', '')}")
+
+        species_recommendations = self.recommendations['species']
+        for species, count in species_count.items():
+            recommendation = species_recommendations.get(species)
+            if count > 0 and recommendation and recommendation['message']:
+                print(recommendation['message'])
+
+    def expected_files(self, species_count):
+        """Return the files expected for a run given its species counts.
+
+        Returns:
+            List of (label, patterns, expected count) tuples
+        """
+        entries = list(self.recommendations['run_files'])
+        species_recommendations = self.recommendations['species']
+        for species, count in species_count.items():
+            if count > 0 and species in species_recommendations:
+                entries.extend(species_recommendations[species]['files'])
+        return [(entry.get('label', ', '.join(entry.get('patterns', []))),
+                 entry.get('patterns', []), entry.get('count', 1)) for entry in entries]
+
+    def check_run_files(self, directory, species_count):
+        """Check which expected files are present below a run directory.
+
+        Args:
+            directory: Run directory, scanned once
+            species_count: Species counts from count_species_in_file
+
+        Returns:
+            Tuple of (RunFileIndex, list of (label, expected count, found paths))
+        """
+        index = RunFileIndex(directory)
+        return index, [(label, expected, index.find(patterns))
+                       for label, patterns, expected in self.expected_files(species_count)]
+
+    def print_file_check(self, directory, species_count):
+        """Print which expected files are present or missing in the run directory."""
+        started = time.perf_counter()
+        index, results = self.check_run_files(directory, species_count)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        print(f"\n---\nFile check in {directory} ({index.file_count} files indexed in {elapsed_ms:.1f} ms):")
+        missing = 0
+        for label, expected, found in results:
+            if len(found) >= expected:
+                print(f"✓ {label} ({len(found)} found)")
+            else:
+                missing += 1
+                print(f"✗ {label}: found {len(found)} of {expected}")
+        if missing:
+            print(f"{missing} expected file(s) missing")
+        else:
+            print("All expected files present")
+        return missing
+
+    def check_species(self, file_path, verbose=False, run_dir=None):
+        """Main method to check species in QC file.
+
+        Args:
+            file_path: QC CSV file
+            verbose: Print the file being read
+            run_dir: Run directory checked for the expected files
+                (default: the directory containing the QC file)
+        """
+        with telemetry.span('check_species', file=str(file_path)):
+            return self._check_species(file_path, verbose, run_dir)
+
+    def _check_species(self, file_path, verbose=False, run_dir=None):
         if verbose:
             print(f"Reading data from file: {file_path}")
 
@@ -115,4 +238,11 @@ class SpeciesChecker:
         # Print recommendations
         self.print_species_recommendations(species_count)
         
+        # Check the run directory for the expected files
+        run_dir = run_dir or os.path.dirname(os.path.abspath(file_path))
+        if os.path.isdir(run_dir):
+            self.print_file_check(run_dir, species_count)
+        else:
+            log_with_timestamp(f"Warning: Run directory '{run_dir}' not found, skipping file check", file=sys.stderr)
+        
         return True
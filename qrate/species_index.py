@@ -0,0 +1,151 @@
+"""Compact integer indexes over the species mapping files.
+
+The scheme, synonym and complex mappings are normalised into integer IDs
+once: every species and scheme name is interned and numbered, and each
+relationship becomes a frozenset of packed ``(a, b)`` ID pairs. A row's
+SPECIES_OBS, SPECIES_EXP and SCHEME are translated to IDs once, and every
+species operator is then a single integer set membership test.
+
+Frozensets of small ints are compact and never written to after they are
+built, so worker processes forked after the index is loaded share its pages.
+"""
+
+import sys
+
+# Returned for names that appear in no mapping; never part of any pair
+UNKNOWN = -1
+
+
+class RowSpecies:
+    """Species and scheme IDs of one row, as read by the species operators."""
+
+    __slots__ = ('obs', 'exp', 'scheme', 'obs_stripped', 'exp_stripped')
+
+    def __init__(self, obs, exp, scheme, obs_stripped, exp_stripped):
+        self.obs = obs
+        self.exp = exp
+        self.scheme = scheme
+        self.obs_stripped = obs_stripped
+        self.exp_stripped = exp_stripped
+
+
+class SpeciesIndex:
+    """Integer lookup tables for the species scheme, synonym and complex mappings.
+
+    A relationship is None when its mapping file could not be loaded, so the
+    operators can keep their behaviour for missing mappings.
+    """
+
+    def __init__(self, scheme_mapping=None, synonym_mapping=None, complex_mapping=None):
+        self.species_ids = {}
+        self.scheme_ids = {}
+        self._last_key = None
+        self._last_ids = None
+
+        self.scheme_pairs = None
+        if isinstance(scheme_mapping, dict):
+            pairs = set()
+            for scheme, species_list in scheme_mapping.items():
+                scheme_id = self._scheme_id(scheme)
+                for species in _as_list(species_list):
+                    pairs.add(self.pack(scheme_id, self._species_id(species)))
+            self.scheme_pairs = frozenset(pairs)
+
+        self.synonym_pairs = None
+        if isinstance(synonym_mapping, dict):
+            pairs = set()
+            synonyms = synonym_mapping.get('synonyms') or {}
+            if isinstance(synonyms, dict):
+                for species_obs, species_exp in synonyms.items():
+                    if isinstance(species_obs, str) and isinstance(species_exp, str):
+                        obs_id = self._species_id(species_obs)
+                        exp_id = self._species_id(species_exp)
+                        # Synonyms match in either direction
+                        pairs.add(self.pack(obs_id, exp_id))
+                        pairs.add(self.pack(exp_id, obs_id))
+            self.synonym_pairs = frozenset(pairs)
+
+        self.complex_ids = None
+        self.complex_pairs = None
+        if isinstance(complex_mapping, dict):
+            complex_ids = set()
+            pairs = set()
+            for complex_name, members in complex_mapping.items():
+                complex_id = self._species_id(complex_name)
+                complex_ids.add(complex_id)
+                for species in _as_list(members):
+                    pairs.add(self.pack(complex_id, self._species_id(species)))
+            self.complex_ids = frozenset(complex_ids)
+            self.complex_pairs = frozenset(pairs)
+
+    def _species_id(self, name):
+        name = sys.intern(str(name))
+        species_id = self.species_ids.get(name)
+        if species_id is None:
+            species_id = self.species_ids[name] = len(self.species_ids)
+        return species_id
+
+    def _scheme_id(self, name):
+        name = sys.intern(str(name))
+        scheme_id = self.scheme_ids.get(name)
+        if scheme_id is None:
+            scheme_id = self.scheme_ids[name] = len(self.scheme_ids)
+        return scheme_id
+
+    @staticmethod
+    def pack(a, b):
+        """Pack two IDs into one int; UNKNOWN never produces a stored pair."""
+        return (a << 32) | b
+
+    def row_ids(self, row):
+        """Translate a row's species and scheme to IDs.
+
+        The IDs of the last values looked up are reused, so the species
+        operators of one row translate it once. The cache is keyed on the
+        values rather than the row, so a row changed between calls is
+        translated again.
+        """
+        species_obs = row.get('SPECIES_OBS', '')
+        species_exp = row.get('SPECIES_EXP', '')
+        scheme = row.get('SCHEME', '')
+        key = (species_obs, species_exp, scheme)
+        if key == self._last_key:
+            return self._last_ids
+        get_species = self.species_ids.get
+        obs = get_species(species_obs, UNKNOWN)
+        exp = get_species(species_exp, UNKNOWN)
+        ids = RowSpecies(
+            obs,
+            exp,
+            self.scheme_ids.get(scheme, UNKNOWN),
+            get_species(species_obs.strip(), UNKNOWN) if species_obs else obs,
+            get_species(species_exp.strip(), UNKNOWN) if species_exp else exp,
+        )
+        self._last_key = key
+        self._last_ids = ids
+        return ids
+
+    def scheme_compatible(self, ids):
+        """True/False for a known scheme, None when the scheme is not in the mapping."""
+        if ids.scheme == UNKNOWN:
+            return None
+        return ids.obs != UNKNOWN and self.pack(ids.scheme, ids.obs) in self.scheme_pairs
+
+    def synonym_match(self, ids):
+        if ids.obs_stripped == UNKNOWN or ids.exp_stripped == UNKNOWN:
+            return False
+        return self.pack(ids.obs_stripped, ids.exp_stripped) in self.synonym_pairs
+
+    def within_complex(self, ids):
+        """True/False when SPECIES_EXP is a complex, None when it is not."""
+        if ids.exp == UNKNOWN or ids.exp not in self.complex_ids:
+            return None
+        return ids.obs != UNKNOWN and self.pack(ids.exp, ids.obs) in self.complex_pairs
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return value
+    return [value]
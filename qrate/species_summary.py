@@ -0,0 +1,190 @@
+"""Streaming species counts over many or very large QC sheets.
+
+Each file is read once, line by line, and only the counts are kept, so memory
+stays flat however large the input is. Plain files are split into byte ranges
+that are counted in parallel by worker processes; gzip, bzip2 and xz files
+cannot be seeked into and are counted whole by a single worker.
+
+A row is counted for a species when any cell contains the species name, and
+for 'no identification' when any cell contains it in any case, as in
+``SpeciesChecker``. Names without commas, quotes or line breaks cannot span
+cells, so they are matched against the raw line without parsing it; other
+names fall back to splitting the line into cells with the csv module. Rows
+are assumed to be one line each, which is how QC sheets are written.
+"""
+
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+NO_IDENTIFICATION = 'no identification'
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# Ranges smaller than this are not worth a separate task
+MIN_SPLIT_BYTES = 4 * 1024 * 1024
+OUTPUT_FORMATS = ('text', 'json')
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSED_OPENERS
+
+
+def needs_csv_parsing(name):
+    """Whether a name could straddle cells in the raw line text."""
+    return any(char in name for char in ',"\r\n')
+
+
+def new_counts(species_list):
+    return {'rows': 0, 'species': {species: 0 for species in species_list}, NO_IDENTIFICATION: 0}
+
+
+def merge_counts(total, counts):
+    """Add counts into total in place and return total."""
+    total['rows'] += counts['rows']
+    for species, count in counts['species'].items():
+        total['species'][species] = total['species'].get(species, 0) + count
+    total[NO_IDENTIFICATION] += counts[NO_IDENTIFICATION]
+    return total
+
+
+def count_lines(lines, species_list):
+    """Count data rows per species and with 'no identification'.
+
+    Args:
+        lines: Iterable of decoded data lines (header excluded)
+        species_list: Species names to count
+
+    Returns:
+        Counts dictionary with 'rows', 'species' and 'no identification'
+    """
+    counts = new_counts(species_list)
+    species_counts = counts['species']
+    raw_names = [name for name in species_list if not needs_csv_parsing(name)]
+    parsed_names = [name for name in species_list if needs_csv_parsing(name)]
+    rows = no_identification = 0
+    for line in lines:
+        if not line.strip('\r\n'):
+            continue
+        rows += 1
+        for name in raw_names:
+            if name in line:
+                species_counts[name] += 1
+        if parsed_names:
+            cells = next(csv.reader([line]), [])
+            for name in parsed_names:
+                if any(name in cell for cell in cells):
+                    species_counts[name] += 1
+        if NO_IDENTIFICATION in line.lower():
+            no_identification += 1
+    counts['rows'] = rows
+    counts[NO_IDENTIFICATION] = no_identification
+    return counts
+
+
+def _range_lines(path, start, end):
+    """Yield decoded lines starting within [start, end) of a plain file, skipping the header."""
+    with open(path, 'rb') as f:
+        if start == 0:
+            position = len(f.readline())
+        else:
+            # A line belongs to the range it starts in
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8', errors='replace')
+
+
+def _compressed_lines(path):
+    with COMPRESSED_OPENERS[os.path.splitext(path)[1].lower()](path, 'rt', newline='',
+                                                                  errors='replace') as f:
+        next(f, None)
+        yield from f
+
+
+def _count_task(path, start, end, species_list):
+    if start is None:
+        lines = _compressed_lines(path)
+    else:
+        lines = _range_lines(path, start, end)
+    return path, count_lines(lines, species_list)
+
+
+def plan_tasks(paths, workers):
+    """Split files into (path, start, end) tasks; start is None for a whole compressed file."""
+    tasks = []
+    for path in paths:
+        if is_compressed(path):
+            tasks.append((path, None, None))
+            continue
+        size = os.path.getsize(path)
+        if size == 0:
+            tasks.append((path, 0, 0))
+            continue
+        splits = max(1, min(workers, size // MIN_SPLIT_BYTES))
+        step = -(-size // splits)
+        tasks.extend((path, start, min(start + step, size)) for start in range(0, size, step))
+    return tasks
+
+
+def summarize_species(paths, species_list, workers=1):
+    """Count species across files.
+
+    Args:
+        paths: QC CSV files, optionally gzip/bzip2/xz compressed
+        species_list: Species names to count
+        workers: Number of worker processes
+
+    Returns:
+        Tuple of ({path: counts}, total counts)
+
+    Raises:
+        OSError: If a file cannot be read
+    """
+    paths = list(dict.fromkeys(paths))
+    for path in paths:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"File '{path}' not found")
+
+    per_file = {path: new_counts(species_list) for path in paths}
+    tasks = plan_tasks(paths, workers)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_count_task, *task, species_list) for task in tasks]
+            for future in futures:
+                path, counts = future.result()
+                merge_counts(per_file[path], counts)
+    else:
+        for task in tasks:
+            path, counts = _count_task(*task, species_list)
+            merge_counts(per_file[path], counts)
+
+    total = new_counts(species_list)
+    for counts in per_file.values():
+        merge_counts(total, counts)
+    return per_file, total
+
+
+def format_counts(counts):
+    """Format counts in the wording of the --check-species report."""
+    lines = [f"There are {count} samples for {species}." for species, count in counts['species'].items()]
+    lines.append(f"There are {counts[NO_IDENTIFICATION]} samples with 'No identification'.")
+    lines.append(f"Rows: {counts['rows']}")
+    return '\n'.join(lines)
+
+
+def format_summary(per_file, total, output_format='text'):
+    """Format per-file and total counts as text or JSON."""
+    if output_format == 'json':
+        return json.dumps({'files': per_file, 'total': total}, indent=2)
+
+    sections = [f"== {path} ==\n{format_counts(counts)}" for path, counts in per_file.items()]
+    if len(per_file) > 1:
+        sections.append(f"== TOTAL ({len(per_file)} files) ==\n{format_counts(total)}")
+    return '\n\n'.join(sections)
@@ -0,0 +1,286 @@
+"""Optional run instrumentation for QRate.
+
+Records spans around the main processing stages, row and rule-hit counters,
+and latency histograms, then exports them either as a Prometheus textfile
+(for the node_exporter textfile collector) or as an OTLP JSON file.
+
+Instrumentation is disabled by default. While disabled, ``active`` is None and
+the instrumented call sites skip all timing and bookkeeping, so a normal run
+pays only for a single ``is None`` check per call.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Bucket upper bounds in seconds, tuned for per-row rule evaluation through
+# to whole-file stages.
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+                   0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+EXPORT_FORMATS = ('prometheus', 'otlp')
+
+METRIC_HELP = {
+    'qrate_rows_total': "Rows handled by each QRate stage",
+    'qrate_rule_hits_total': "Rules applied to a row, by rule and field",
+    'qrate_stage_duration_seconds': "Duration of each QRate stage",
+    'qrate_rule_evaluation_seconds': "Latency of evaluate_mms_rule per row and field",
+    'qrate_run_rows_per_second': "Curation throughput of the last run",
+    'qrate_run_timestamp_seconds': "Unix time the last run finished",
+    'qrate_run_info': "Input and rules file of the last run",
+}
+
+# Active Telemetry instance, or None when instrumentation is disabled
+active = None
+
+
+def enable(service_name="qrate"):
+    """Enable instrumentation and return the active Telemetry instance."""
+    global active
+    active = Telemetry(service_name)
+    return active
+
+
+def disable():
+    """Disable instrumentation and discard anything recorded."""
+    global active
+    active = None
+
+
+def span(name, **attributes):
+    """Return a context manager recording a span, or a no-op when disabled."""
+    if active is None:
+        return nullcontext()
+    return active.span(name, **attributes)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ''
+    parts = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Histogram:
+    """Cumulative-bucket histogram matching Prometheus semantics."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative(self):
+        """Yield (upper_bound, cumulative_count) pairs including +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Telemetry:
+    """In-memory collector for spans, counters, gauges and histograms."""
+
+    def __init__(self, service_name="qrate"):
+        self.service_name = service_name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._span_stack = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record a span for the enclosed block and its duration histogram."""
+        span_id = os.urandom(8).hex()
+        parent_id = self._span_stack[-1] if self._span_stack else ''
+        self._span_stack.append(span_id)
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield attributes
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self._span_stack.pop()
+            self.spans.append({
+                'name': name,
+                'span_id': span_id,
+                'parent_span_id': parent_id,
+                'start_ns': start_ns,
+                'end_ns': start_ns + int(duration * 1e9),
+                'attributes': dict(attributes),
+                'status': status,
+            })
+            self.observe('qrate_stage_duration_seconds', duration, stage=name)
+
+    def add(self, name, amount=1, **labels):
+        """Increment a counter."""
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to the given value."""
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram."""
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def export(self, path, fmt='prometheus'):
+        """Write recorded telemetry to path in the requested format."""
+        if fmt == 'prometheus':
+            content = self.to_prometheus()
+        elif fmt == 'otlp':
+            content = self.to_otlp()
+        else:
+            raise ValueError(f"Unknown metrics format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+
+        # Write to a temporary file first so collectors never see a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self):
+        """Render counters, gauges and histograms in Prometheus text format."""
+        lines = []
+        for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+            for name in sorted(metrics):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(metrics[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        for name in sorted(self.histograms):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(self.histograms[name].items()):
+                for bound, count in histogram.cumulative():
+                    labels = _format_labels(key, [('le', _format_bound(bound))])
+                    lines.append(f"{name}_bucket{labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum!r}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_otlp(self):
+        """Render spans and metrics as OTLP/JSON, one export request per line."""
+        now_ns = str(time.time_ns())
+        resource = {'attributes': [_otlp_attribute('service.name', self.service_name)]}
+        scope = {'name': 'qrate', 'version': _package_version()}
+
+        spans = []
+        for s in self.spans:
+            spans.append({
+                'traceId': self.trace_id,
+                'spanId': s['span_id'],
+                'parentSpanId': s['parent_span_id'],
+                'name': s['name'],
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(s['start_ns']),
+                'endTimeUnixNano': str(s['end_ns']),
+                'attributes': [_otlp_attribute(k, v) for k, v in sorted(s['attributes'].items())],
+                'status': {'code': 2 if s['status'] == 'error' else 1},
+            })
+
+        metrics = []
+        for name in sorted(self.counters):
+            metrics.append({
+                'name': name,
+                'description': METRIC_HELP.get(name, ''),
+                'sum': {
+                    'aggregationTemporality': 2,  # CUMULATIVE
+                    'isMonotonic': True,
+                    'dataPoints': [
+                        {'attributes': [_otlp_attribute(k, v) for k, v in key],
+                         'timeUnixNano': now_ns, 'asInt': str(value)}
+                        for key, value in sorted(self.counters[name].items())
+                    ],
+                },
+            })
+        for name in sorted(self.gauges):
+            metrics.append({
+                'name': name,
+                'description': METRIC_HELP.get(name, ''),
+                'gauge': {
+                    'dataPoints': [
+                        {'attributes': [_otlp_attribute(k, v) for k, v in key],
+                         'timeUnixNano': now_ns, 'asDouble': float(value)}
+                        for key, value in sorted(self.gauges[name].items())
+                    ],
+                },
+            })
+        for name in sorted(self.histograms):
+            metrics.append({
+                'name': name,
+                'description': METRIC_HELP.get(name, ''),
+                'unit': 's',
+                'histogram': {
+                    'aggregationTemporality': 2,
+                    'dataPoints': [
+                        {'attributes': [_otlp_attribute(k, v) for k, v in key],
+                         'timeUnixNano': now_ns,
+                         'count': str(h.count),
+                         'sum': h.sum,
+                         'bucketCounts': [str(c) for c in h.counts],
+                         'explicitBounds': list(h.buckets)}
+                        for key, h in sorted(self.histograms[name].items())
+                    ],
+                },
+            })
+
+        traces = {'resourceSpans': [{'resource': resource,
+                                     'scopeSpans': [{'scope': scope, 'spans': spans}]}]}
+        metric_data = {'resourceMetrics': [{'resource': resource,
+                                            'scopeMetrics': [{'scope': scope, 'metrics': metrics}]}]}
+        return json.dumps(traces) + '\n' + json.dumps(metric_data) + '\n'
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def _package_version():
+    from . import __version__
+    return __version__
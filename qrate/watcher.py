@@ -0,0 +1,256 @@
+"""Watch a directory tree and curate QC sheets as they land.
+
+On Linux the watcher uses inotify through ctypes, so no extra dependency is
+needed; elsewhere, or if inotify cannot be initialised, it falls back to
+polling the tree. Events for a file are debounced: a file is only curated once
+no further writes have been seen for the debounce interval and its size and
+modification time have stopped changing.
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_PATTERN = "standard_bacteria_qc.csv"
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def log_with_timestamp(message, file=None):
+    """Print message with timestamp prefix."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    formatted_message = f"[{timestamp}] {message}"
+    print(formatted_message, file=file, flush=True)
+
+
+def is_qc_file(path, pattern=DEFAULT_PATTERN):
+    """Check whether a path is a QC sheet to curate (and not curated output)."""
+    name = os.path.basename(path)
+    return fnmatch.fnmatch(name, pattern) and '.curated' not in name
+
+
+class PollingWatcher:
+    """Detect new and changed files by comparing directory snapshots."""
+
+    def __init__(self, directory, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def existing_files(self):
+        return list(self.snapshot)
+
+    def wait(self, timeout):
+        """Sleep up to timeout (at most one poll interval) and return changed paths."""
+        time.sleep(max(0.0, min(timeout, self.poll_interval)))
+        snapshot = self.scan()
+        changed = [path for path, state in snapshot.items() if self.snapshot.get(path) != state]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Recursive directory watcher built on Linux inotify."""
+
+    def __init__(self, directory):
+        library = ctypes.util.find_library('c') or 'libc.so.6'
+        self.libc = ctypes.CDLL(library, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directory = directory
+        self.watches = {}
+        self.found = []
+        self.add_tree(directory)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watches[wd] = path
+
+    def add_tree(self, directory):
+        """Watch a directory and every directory below it.
+
+        Files already present in newly added directories are recorded in
+        ``found``, so files written before their directory's watch was set up
+        are not missed.
+        """
+        for root, _, files in os.walk(directory):
+            self.add_watch(root)
+            self.found.extend(os.path.join(root, name) for name in files)
+
+    def existing_files(self):
+        found, self.found = self.found, []
+        return found
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds and return paths that were written."""
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; rescan so nothing is lost
+                for path in self.watches.values():
+                    try:
+                        changed.extend(os.path.join(path, n) for n in os.listdir(path))
+                    except OSError:
+                        pass
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            parent = self.watches.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self.add_tree(path)
+                    except OSError:
+                        pass
+                    changed.extend(self.existing_files())
+            else:
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(directory, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Return an inotify watcher when available, otherwise a polling watcher."""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            log_with_timestamp(f"inotify unavailable ({e}), falling back to polling", file=sys.stderr)
+    return PollingWatcher(directory, poll_interval)
+
+
+def file_state(path):
+    """Return (mtime_ns, size) for a path, or None if it no longer exists."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch_directory(directory, handler, pattern=DEFAULT_PATTERN, debounce=DEFAULT_DEBOUNCE,
+                    poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True,
+                    process_existing=False, max_files=None):
+    """Call handler(path, landed_at) for every QC sheet written below directory.
+
+    Args:
+        directory: Directory tree to watch
+        handler: Callable receiving the settled file path and the time.time()
+            at which it was last written
+        pattern: Glob matched against file names
+        debounce: Seconds without writes before a file is considered complete
+        poll_interval: Seconds between scans when polling
+        use_inotify: Try inotify before falling back to polling
+        process_existing: Also curate matching files present at startup
+        max_files: Stop after handling this many files (None watches forever)
+
+    Returns:
+        Number of files handled
+    """
+    watcher = create_watcher(directory, use_inotify, poll_interval)
+    pending = {}
+    handled_states = {}
+    handled = 0
+
+    def schedule(path):
+        if is_qc_file(path, pattern):
+            pending[path] = time.monotonic() + debounce
+
+    existing = watcher.existing_files()
+    if process_existing:
+        for path in existing:
+            schedule(path)
+    else:
+        for path in existing:
+            handled_states[path] = file_state(path)
+
+    try:
+        while max_files is None or handled < max_files:
+            now = time.monotonic()
+            timeout = min(pending.values()) - now if pending else poll_interval
+            for path in watcher.wait(timeout):
+                schedule(path)
+
+            now = time.monotonic()
+            for path, deadline in sorted(pending.items(), key=lambda item: item[1]):
+                if deadline > now:
+                    continue
+                state = file_state(path)
+                if state is None:
+                    del pending[path]
+                    continue
+                # Still being written if modified within the debounce window
+                landed_at = state[0] / 1e9
+                if time.time() - landed_at < debounce:
+                    pending[path] = now + debounce
+                    continue
+                del pending[path]
+                if handled_states.get(path) == state:
+                    continue
+                handled_states[path] = state
+                handler(path, landed_at)
+                handled += 1
+                if max_files is not None and handled >= max_files:
+                    break
+    finally:
+        watcher.close()
+    return handled
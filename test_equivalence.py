@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Differential equivalence tests for the curation engines
+
+Curates generated QC rows with the frozen original engine in qrate.reference
+and every alternate engine in qrate.equivalence (registry, compiled, batch,
+optimized, adaptive, traced, profiles, sharded) and fails if any of them curates a row differently.
+"""
+
+import sys
+
+from qrate.equivalence import ALTERNATE_ENGINES, DEFAULT_ROW_COUNT, DEFAULT_SEED, format_report, run_equivalence
+from qrate.main import find_config_file
+from qrate.ruleset import load_rules
+
+
+def check_rules(rules_file, count=DEFAULT_ROW_COUNT, seed=DEFAULT_SEED):
+    """Run every alternate engine against the reference on one ruleset.
+
+    Returns:
+        List of engines whose results differ from the reference
+    """
+    rules, _ = load_rules(rules_file)
+    results = run_equivalence(rules, count=count, seed=seed)
+    print(format_report(results, seed))
+    assert [result['engine'] for result in results] == list(ALTERNATE_ENGINES)
+    return [result['engine'] for result in results if result['mismatches']]
+
+
+def test_default_rules_equivalent():
+    """Test that every engine matches the reference on the built-in rules"""
+    differing = check_rules(find_config_file('rules.yaml'))
+    assert not differing, f"engines differ from the reference: {', '.join(differing)}"
+
+
+def test_second_seed_equivalent():
+    """Test the built-in rules on a second set of generated rows"""
+    differing = check_rules(find_config_file('rules.yaml'), seed=DEFAULT_SEED + 1)
+    assert not differing, f"engines differ from the reference: {', '.join(differing)}"
+
+
+def main():
+    """Run the equivalence tests"""
+    print("Testing QRate Engine Equivalence...\n")
+
+    tests = [test_default_rules_equivalent, test_second_seed_equivalent]
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {e}")
+        print()
+
+    print(f"Results: {passed}/{len(tests)} tests passed")
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+"""
+Performance budget tests for the qrate command
+
+Runs qrate.main:main in-process on generated QC sheets of several sizes and
+checks throughput and peak traced memory against the budgets committed in
+performance_budgets.json, and the startup time of a fresh `qrate --version`.
+The per-stage peak bytes per row from --mem-report are benchmarked too.
+Results are compared with the previous baseline, which --save-baseline
+replaces.
+
+Timings depend on the machine, so they are budgeted relative to a fixed
+pure-Python calibration loop timed in the same session: throughput as rows
+curated per calibration loop, and startup as a multiple of the loop. Traced
+memory does not depend on the machine and is budgeted in MiB.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performance_budgets.json')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performance_baseline.json')
+# Timed runs per fixture; the fastest is kept to reduce noise
+REPEATS = 3
+SEED = 1
+# Rows of the calibration loop, which takes about 0.15 s on a current machine
+CALIBRATION_ROWS = 50000
+
+_results = {}
+
+
+def load_budgets(path=BUDGETS_FILE):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_fixture(path, rows):
+    """Write a QC sheet of generated rows that exercise the default rules."""
+    from qrate.equivalence import generate_rows, value_pools
+    from qrate.main import find_config_file
+    from qrate.ruleset import load_rules
+
+    rules, _ = load_rules(find_config_file('rules.yaml'))
+    data = generate_rows(value_pools(rules, SEED), rows, SEED)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(data[0]))
+        writer.writeheader()
+        writer.writerows(data)
+
+
+def run_qrate(argv):
+    """Run qrate.main:main in-process with its output captured."""
+    from qrate.main import main
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return main(argv)
+
+
+def calibrate(repeats=5):
+    """Fastest time of a fixed workload like curation's: parse, compare and copy rows."""
+    rows = [{'ISOLATE': f"2025-{i:06d}", 'COVERAGE': str(i % 97), 'SPECIES_OBS': ' Escherichia coli '}
+            for i in range(CALIBRATION_ROWS)]
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(rows[0]) + ['MMS103'])
+        for row in rows:
+            row = dict(row)
+            low = float(row['COVERAGE']) < 40
+            match = row['SPECIES_OBS'].strip() == 'Escherichia coli'
+            row['MMS103'] = 'FAIL' if low and match else ''
+            writer.writerow(row)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_startup(repeats=REPEATS):
+    """Fastest wall time of a fresh `qrate --version`, in seconds."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                                    os.environ.get('PYTHONPATH')])))
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'qrate.main', '--version'], capture_output=True, env=env, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_fixture(rows, directory, repeats=REPEATS):
+    """Curate a generated sheet of the given size and measure it.
+
+    Returns:
+        Dictionary with rows_per_second (fastest of repeats), peak_mib
+        (peak traced memory of one run) and <stage>_peak_bytes_per_row from
+        a --mem-report run
+    """
+    input_file = os.path.join(directory, f"qc_{rows}.csv")
+    output_file = os.path.join(directory, f"qc_{rows}.curated.csv")
+    write_fixture(input_file, rows)
+    argv = [input_file, '-o', output_file]
+
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if run_qrate(argv) != 0:
+            raise RuntimeError(f"qrate failed on {input_file}")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        run_qrate(argv)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    measured = {'rows_per_second': rows / best, 'peak_mib': peak / (1024 * 1024)}
+
+    history_file = os.path.join(directory, f"qc_{rows}.memory.jsonl")
+    run_qrate(argv + ['--mem-history', history_file])
+    with open(history_file, 'r') as f:
+        record = json.loads(f.readline())
+    for stage in record['stages']:
+        if stage['peak_bytes_per_row'] is not None:
+            measured[f"{stage['stage']}_peak_bytes_per_row"] = stage['peak_bytes_per_row']
+    return measured
+
+
+def measure(budgets=None):
+    """Measure startup and every fixture in the budgets file, once per process."""
+    if not _results:
+        budgets = budgets or load_budgets()
+        _results['calibration_seconds'] = calibrate()
+        _results['startup_seconds'] = measure_startup()
+        with tempfile.TemporaryDirectory(prefix='qrate-perf-') as directory:
+            _results['fixtures'] = {
+                size: measure_fixture(int(size), directory) for size in budgets['fixtures']
+            }
+    return _results
+
+
+def check(value, budget, tolerance, higher_is_better):
+    """Whether a measurement is within its budget allowing for the tolerance."""
+    if higher_is_better:
+        return value >= budget * (1 - tolerance)
+    return value <= budget * (1 + tolerance)
+
+
+def budget_checks(results, budgets):
+    """Return (metric, value, budget, higher_is_better, passed) for every budget."""
+    tolerance = budgets.get('tolerance', 0.0)
+    calibration = results['calibration_seconds']
+    checks = [('startup_calibrations', results['startup_seconds'] / calibration,
+               budgets['max_startup_calibrations'], False)]
+    for size, fixture_budgets in budgets['fixtures'].items():
+        measured = results['fixtures'][size]
+        checks.append((f"{size} rows: rows_per_calibration", measured['rows_per_second'] * calibration,
+                       fixture_budgets['min_rows_per_calibration'], True))
+        checks.append((f"{size} rows: peak_mib", measured['peak_mib'], fixture_budgets['max_peak_mib'], False))
+    return [(name, value, budget, higher, check(value, budget, tolerance, higher))
+            for name, value, budget, higher in checks]
+
+
+def flatten(results):
+    """Map metric names to values, as used in budget_checks."""
+    values = {name: results[name] for name in ('calibration_seconds', 'startup_seconds') if name in results}
+    for size, measured in results.get('fixtures', {}).items():
+        for metric, value in measured.items():
+            values[f"{size} rows: {metric}"] = value
+    return values
+
+
+def format_report(results, budgets, baseline=None):
+    """Format the budget checks and the change from a baseline, if any."""
+    previous = flatten(baseline) if baseline else {}
+    if baseline and 'calibration_seconds' in baseline:
+        previous.update((name, value) for name, value, *_ in budget_checks(baseline, budgets))
+    lines = [f"{'metric':<36} {'current':>12} {'budget':>12} {'baseline':>12} {'change':>8}  status"]
+
+    def add_line(name, value, budget, status):
+        before = previous.get(name)
+        change = f"{(value - before) / before:+.1%}" if before else '-'
+        lines.append(f"{name:<36} {value:>12.3f} {'-' if budget is None else f'{budget:.3f}':>12} "
+                     f"{'-' if before is None else f'{before:.3f}':>12} {change:>8}  {status}")
+
+    checks = budget_checks(results, budgets)
+    for name, value, budget, higher, passed in checks:
+        add_line(name, value, budget, 'ok' if passed else 'OVER BUDGET')
+    # Raw timings and per-stage memory, compared with the baseline only
+    for name, value in flatten(results).items():
+        add_line(name, value, None, 'tracked')
+    lines.append(f"Tolerance: {budgets.get('tolerance', 0.0):.0%}; rows per calibration loop are minimums, "
+                 f"startup (in calibration loops) and peak memory maximums")
+    return '\n'.join(lines)
+
+
+def _report(kind):
+    budgets = load_budgets()
+    failed = [name for name, _, _, _, passed in budget_checks(measure(budgets), budgets)
+              if not passed and kind in name]
+    if failed:
+        print(f"✗ Over budget: {', '.join(failed)}")
+        return False
+    print(f"✓ {kind} within budget")
+    return True
+
+
+def test_startup_budget():
+    """Test that a fresh qrate process starts within budget"""
+    assert _report('startup_calibrations'), "startup is over budget"
+
+
+def test_throughput_budget():
+    """Test throughput on every fixture size"""
+    assert _report('rows_per_calibration'), "throughput is under budget"
+
+
+def test_memory_budget():
+    """Test peak traced memory on every fixture size"""
+    assert _report('peak_mib'), "peak memory is over budget"
+
+
+def main():
+    """Run the performance budget tests and print the comparison report"""
+    parser = argparse.ArgumentParser(description="Check qrate performance against committed budgets")
+    parser.add_argument("--budgets", default=BUDGETS_FILE, help="Budgets JSON file (default: %(default)s)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Results of a previous run to compare with (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="Replace the baseline with this run's results")
+    args = parser.parse_args()
+
+    print("Testing QRate Performance Budgets...\n")
+    budgets = load_budgets(args.budgets)
+    results = measure(budgets)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    tests = [test_startup_budget, test_throughput_budget, test_memory_budget]
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except AssertionError:
+            pass
+    print()
+    print(format_report(results, budgets, baseline))
+    print(f"\nResults: {passed}/{len(tests)} tests passed")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    return 0 if passed == len(tests) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())